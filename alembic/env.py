@@ -9,17 +9,27 @@ from alembic import context
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 
+from app.config import settings
 from app.database import Base
 from app.models import User, Advertisement
 
 
 config = context.config
+# Миграции идут в ту же БД, что и приложение (DATABASE_URL из Settings)
+config.set_main_option("sqlalchemy.url", settings.DATABASE_URL)
 
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
  
 target_metadata = Base.metadata
 
+
+def include_name(name, type_, parent_names):
+    # FTS5-таблица и её служебные таблицы создаются миграцией 0002, в моделях их нет
+    if type_ == "table":
+        return not name.startswith("advertisements_fts")
+    return True
+
 def run_migrations_offline() -> None:
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
@@ -27,6 +37,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_name=include_name,
     )
 
     with context.begin_transaction():
@@ -41,7 +52,12 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
+            # Ревизии с autocommit-блоками (backfill, CREATE INDEX CONCURRENTLY)
+            # фиксируют транзакцию посреди миграции: каждая ревизия — своя транзакция
+            transaction_per_migration=True,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,107 @@
+"""full-text search index for advertisements
+
+SQLite: FTS5 external-content table advertisements_fts and triggers that
+keep it in sync. PostgreSQL: generated tsvector column search_vector
+(russian + english) with a GIN index. Existing rows are indexed during
+the upgrade.
+
+PostgreSQL locking: ADD COLUMN ... GENERATED ... STORED rewrites
+advertisements under an ACCESS EXCLUSIVE lock (reads and writes wait for
+the whole rewrite); plan it for a maintenance window on large tables. The
+GIN index is then built with CREATE INDEX CONCURRENTLY outside the
+migration transaction, so that step does not block writes.
+
+The DDL is a frozen copy of app/fulltext.py at this revision: later edits
+to the application must not change what this migration does.
+
+Databases created by create_all before migrations existed already match
+0001: run `alembic stamp 0001` once, then `alembic upgrade head`.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 17:20:05.104382
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+FTS_TABLE = "advertisements_fts"
+
+SQLITE_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description,
+        content='advertisements', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS advertisements_fts_ai AFTER INSERT ON advertisements BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS advertisements_fts_ad AFTER DELETE ON advertisements BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS advertisements_fts_au AFTER UPDATE OF title, description ON advertisements BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    # индексирует строки, которые уже были в таблице
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+POSTGRESQL_COLUMN = """
+    ALTER TABLE advertisements ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+"""
+
+POSTGRESQL_INDEX = (
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_advertisements_search_vector "
+    "ON advertisements USING gin (search_vector)"
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for statement in SQLITE_DDL:
+            op.execute(statement)
+    elif dialect == "postgresql":
+        # генерируемая колонка вычисляется для всех строк при ADD COLUMN
+        op.execute(POSTGRESQL_COLUMN)
+        # CONCURRENTLY нельзя выполнять внутри транзакции
+        with op.get_context().autocommit_block():
+            op.execute(POSTGRESQL_INDEX)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for trigger in ("advertisements_fts_ai", "advertisements_fts_ad", "advertisements_fts_au"):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS advertisements_fts")
+    elif dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_advertisements_search_vector")
+        op.execute("ALTER TABLE advertisements DROP COLUMN IF EXISTS search_vector")
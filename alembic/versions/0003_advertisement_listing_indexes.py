@@ -0,0 +1,31 @@
+"""composite indexes for advertisement listing filters and sorts
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 18:02:37.448219
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_advertisements_price_id', 'advertisements', ['price', 'id'], unique=False)
+    op.create_index('ix_advertisements_created_at_id', 'advertisements', ['created_at', 'id'], unique=False)
+    op.create_index(
+        'ix_advertisements_owner_id_created_at', 'advertisements', ['owner_id', 'created_at', 'id'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_advertisements_owner_id_created_at', table_name='advertisements')
+    op.drop_index('ix_advertisements_created_at_id', table_name='advertisements')
+    op.drop_index('ix_advertisements_price_id', table_name='advertisements')
@@ -0,0 +1,35 @@
+"""partial index over active users
+
+owner_id and created_at lookups on advertisements are already served by
+the leading columns of ix_advertisements_owner_id_created_at and
+ix_advertisements_created_at_id (0003); separate single-column indexes
+would only add write cost.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 18:31:12.905114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_users_active_id', 'users', ['id'], unique=False,
+        sqlite_where=sa.text('is_active = 1'),
+        postgresql_where=sa.text('is_active'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_active_id', table_name='users')
@@ -0,0 +1,82 @@
+"""row counters for listing totals (include_total)
+
+SQLite: table row_counts, kept exact by triggers on advertisements and
+users, seeded from the current rows. PostgreSQL reads planner estimates
+instead; the table is created everywhere so the schema matches the models.
+
+The trigger DDL is a frozen copy of app/counts.py at this revision.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 18:02:41.517306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+SQLITE_DDL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS advertisements_count_ai AFTER INSERT ON advertisements BEGIN
+        UPDATE row_counts SET count = count + 1 WHERE name = 'advertisements';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS advertisements_count_ad AFTER DELETE ON advertisements BEGIN
+        UPDATE row_counts SET count = count - 1 WHERE name = 'advertisements';
+    END
+    """,
+    # листинг пользователей показывает только активных (is_active = 1)
+    """
+    CREATE TRIGGER IF NOT EXISTS users_count_ai AFTER INSERT ON users BEGIN
+        UPDATE row_counts SET count = count + (new.is_active IS 1) WHERE name = 'users_active';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_count_ad AFTER DELETE ON users BEGIN
+        UPDATE row_counts SET count = count - (old.is_active IS 1) WHERE name = 'users_active';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_count_au AFTER UPDATE OF is_active ON users BEGIN
+        UPDATE row_counts SET count = count + (new.is_active IS 1) - (old.is_active IS 1)
+        WHERE name = 'users_active';
+    END
+    """,
+    """
+    INSERT OR REPLACE INTO row_counts (name, count)
+    SELECT 'advertisements', count(*) FROM advertisements
+    """,
+    """
+    INSERT OR REPLACE INTO row_counts (name, count)
+    SELECT 'users_active', count(*) FROM users WHERE is_active = 1
+    """,
+]
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('row_counts',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    if op.get_bind().dialect.name == "sqlite":
+        # последние операторы заполняют счётчики по уже существующим строкам
+        for statement in SQLITE_DDL:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        for trigger in ("advertisements_count_ai", "advertisements_count_ad",
+                        "users_count_ai", "users_count_ad", "users_count_au"):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.drop_table('row_counts')
@@ -0,0 +1,71 @@
+"""rollup tables for advertisement statistics per owner and per day
+
+Filled from the existing advertisements during the upgrade; afterwards
+app.rollups keeps them current in the transactions of crud writes.
+
+The fill SQL is a frozen copy of app.rollups.rebuild_statements at this
+revision: the migration does not import the app (models, engines).
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 18:31:09.240117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+OWNER_STATS_FILL = """
+    INSERT INTO advertisement_owner_stats (owner_id, count, price_sum, price_min, price_max)
+    SELECT owner_id, count(*), sum(price), min(price), max(price)
+    FROM advertisements
+    GROUP BY owner_id
+"""
+
+# День создания в UTC. SQLite хранит created_at в UTC строкой 'YYYY-MM-DD HH:MM:SS'
+DAY_EXPRESSIONS = {
+    "sqlite": "date(created_at)",
+    "postgresql": "CAST(timezone('UTC', created_at) AS DATE)",
+}
+
+DAILY_STATS_FILL = """
+    INSERT INTO advertisement_daily_stats (day, count, price_sum, price_min, price_max)
+    SELECT {day}, count(*), sum(price), min(price), max(price)
+    FROM advertisements
+    GROUP BY {day}
+"""
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('advertisement_owner_stats',
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('price_sum', sa.BigInteger(), nullable=False),
+    sa.Column('price_min', sa.Integer(), nullable=False),
+    sa.Column('price_max', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('owner_id')
+    )
+    op.create_table('advertisement_daily_stats',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('price_sum', sa.BigInteger(), nullable=False),
+    sa.Column('price_min', sa.Integer(), nullable=False),
+    sa.Column('price_max', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+    day = DAY_EXPRESSIONS.get(op.get_bind().dialect.name, "date(created_at)")
+    op.execute(OWNER_STATS_FILL)
+    op.execute(DAILY_STATS_FILL.format(day=day))
+
+
+def downgrade() -> None:
+    op.drop_table('advertisement_daily_stats')
+    op.drop_table('advertisement_owner_stats')
@@ -0,0 +1,31 @@
+"""token_version on users for token revocation
+
+Bumped on password, group or username change and on soft delete; access
+tokens carry it as the "ver" claim. Existing users start at 0, which
+matches tokens issued before the claim existed.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 19:05:37.802164
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default=sa.text('0'), nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('token_version')
@@ -0,0 +1,27 @@
+"""index refresh tokens by (user_id, expires_at) for the expired-token purge
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 21:05:48.217734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_refresh_tokens_user_id_expires_at', 'refresh_tokens', ['user_id', 'expires_at'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_refresh_tokens_user_id_expires_at', table_name='refresh_tokens')
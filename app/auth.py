@@ -1,41 +1,58 @@
+import hashlib
+import secrets
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import HTTPException, status
 from . import schemas
+from .cache import ExpiringLRUCache
 from .config import settings  # ✅ Используем pydantic-settings
 
 # Secret keys and algorithm
 SECRET_KEY = settings.SECRET_KEY  # ✅ Из конфигурации
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_HOURS = settings.ACCESS_TOKEN_EXPIRE_HOURS
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
+REFRESH_TOKEN_EXPIRE_DAYS = settings.REFRESH_TOKEN_EXPIRE_DAYS
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def generate_refresh_token() -> str:
+    """Непрозрачный refresh-токен; в базе хранится только hash_refresh_token от него."""
+    return secrets.token_urlsafe(32)
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def hash_refresh_token(token: str) -> str:
+    # У токена 256 бит случайности: соль и медленный хеш не нужны
+    return hashlib.sha256(token.encode()).hexdigest()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
+        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Проверенные токены: SHA-256 токена -> TokenData, запись живёт до exp токена.
+# Клиент повторяет один токен в тысячах запросов; попадание в кеш пропускает
+# разбор JOSE и проверку подписи, а просроченный токен заново проверяет
+# jwt.decode, который его отклонит. Сами токены в памяти не хранятся
+token_cache = ExpiringLRUCache(settings.TOKEN_CACHE_SIZE)
+
+def get_token_cache_stats() -> dict:
+    return token_cache.stats()
+
 def verify_token(token: str) -> Optional[schemas.TokenData]:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+    key = hashlib.sha256(token.encode()).digest()
+    token_data = token_cache.get(key)
+    if token_data is not None:
+        return token_data
     
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -46,10 +63,17 @@ def verify_token(token: str) -> Optional[schemas.TokenData]:
         if username is None or user_id is None:
             raise credentials_exception
             
-        return schemas.TokenData(
+        token_data = schemas.TokenData(
             username=username, 
             user_id=user_id, 
-            group=schemas.UserGroup(group) if group else None
+            group=schemas.UserGroup(group) if group else None,
+            token_version=payload.get("ver", 0)
         )
-    except JWTError:
-        raise credentials_exception
\ No newline at end of file
+    except (JWTError, ValueError):
+        raise credentials_exception
+
+    # Токен без exp не кешируем: кешу не от чего отсчитать срок записи
+    expires_at = payload.get("exp")
+    if isinstance(expires_at, (int, float)):
+        token_cache.put(key, token_data, expires_at)
+    return token_data
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""Онлайн-миграции данных: пакетные backfill'ы и индексы без долгих блокировок.
+
+Функции вызываются из ревизий Alembic. Обычная data-миграция — один UPDATE на
+всю таблицу в транзакции миграции, и таблица заблокирована на всё время
+работы. Здесь backfill идёт по первичному ключу пачками, каждая пачка — своя
+короткая транзакция, между пачками пауза. Прогресс пишется в таблицу
+data_migration_checkpoints в той же транзакции, что и пачка: после падения
+повторный ``alembic upgrade head`` продолжит с последней зафиксированной пачки.
+
+Пример ревизии::
+
+    from app.backfill import create_index_concurrently, run_backfill
+
+    advertisements = sa.table("advertisements", sa.column("id"), sa.column("title"),
+                              sa.column("title_normalized"))
+
+    def upgrade():
+        op.add_column("advertisements", sa.Column("title_normalized", sa.String()))
+        run_backfill(
+            "advertisements_title_normalized",
+            advertisements,
+            {"title_normalized": sa.func.lower(advertisements.c.title)},
+            where=advertisements.c.title_normalized.is_(None),
+        )
+        create_index_concurrently("ix_advertisements_title_normalized", "advertisements",
+                                  ["title_normalized"])
+
+Строки, вставленные после начала backfill'а, он не обрабатывает: к этому
+моменту новое значение уже должен записывать код приложения. Операции ревизии
+до run_backfill фиксируются до его начала и при повторном запуске после
+падения выполнятся снова — их лучше вынести в предыдущую ревизию.
+"""
+import logging
+import time
+from typing import Any, Dict, Optional, Sequence
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.engine import Connection, Engine
+
+from .models import DataMigrationCheckpoint
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+PAUSE_SECONDS = 0.05
+
+checkpoints = DataMigrationCheckpoint.__table__
+
+
+def _load_checkpoint(conn: Connection, name: str):
+    return conn.execute(
+        sa.select(checkpoints.c.last_id, checkpoints.c.finished_at).where(checkpoints.c.name == name)
+    ).first()
+
+
+def _save_checkpoint(conn: Connection, name: str, last_id: int, finished: bool = False):
+    values = {"last_id": last_id, "updated_at": sa.func.now()}
+    if finished:
+        values["finished_at"] = sa.func.now()
+    updated = conn.execute(
+        sa.update(checkpoints).where(checkpoints.c.name == name).values(**values)
+    )
+    if updated.rowcount == 0:
+        conn.execute(sa.insert(checkpoints).values(name=name, **values))
+
+
+def backfill(
+    engine: Engine,
+    name: str,
+    table: sa.Table,
+    values: Dict[str, Any],
+    *,
+    where: Optional[sa.ColumnElement] = None,
+    batch_size: int = BATCH_SIZE,
+    pause: float = PAUSE_SECONDS,
+) -> int:
+    """Выполняет UPDATE table SET values пачками по первичному ключу id.
+
+    name — ключ чекпоинта: backfill с тем же именем продолжается с места
+    остановки, завершённый не выполняется повторно. where — дополнительное
+    условие для строк пачки. Возвращает число обновлённых строк.
+    """
+    id_column = table.c.id
+    with engine.begin() as conn:
+        checkpoint = _load_checkpoint(conn, name)
+        if checkpoint is not None and checkpoint.finished_at is not None:
+            logger.info("backfill %s: already finished", name)
+            return 0
+        last_id = checkpoint.last_id if checkpoint is not None else None
+        # Верхняя граница фиксируется на старте
+        max_id = conn.scalar(sa.select(sa.func.max(id_column)))
+
+    updated_total = 0
+    while max_id is not None and (last_id is None or last_id < max_id):
+        with engine.begin() as conn:
+            # Граница пачки — batch_size-й id после last_id: пачки равны по
+            # числу строк даже при дырах в последовательности id
+            next_ids = sa.select(id_column).order_by(id_column).offset(batch_size - 1).limit(1)
+            if last_id is not None:
+                next_ids = next_ids.where(id_column > last_id)
+            upper_id = min(conn.scalar(next_ids) or max_id, max_id)
+
+            stmt = sa.update(table).where(id_column <= upper_id).values(**values)
+            if last_id is not None:
+                stmt = stmt.where(id_column > last_id)
+            if where is not None:
+                stmt = stmt.where(where)
+            updated_total += conn.execute(stmt).rowcount
+            _save_checkpoint(conn, name, upper_id)
+
+        last_id = upper_id
+        logger.info("backfill %s: id <= %s of %s, %s rows updated", name, last_id, max_id, updated_total)
+        if pause:
+            time.sleep(pause)
+
+    with engine.begin() as conn:
+        _save_checkpoint(conn, name, last_id or 0, finished=True)
+    return updated_total
+
+
+def run_backfill(
+    name: str,
+    table: sa.Table,
+    values: Dict[str, Any],
+    *,
+    where: Optional[sa.ColumnElement] = None,
+    batch_size: int = BATCH_SIZE,
+    pause: float = PAUSE_SECONDS,
+) -> int:
+    """backfill() из ревизии Alembic.
+
+    Транзакция миграции фиксируется до начала (autocommit_block), иначе она
+    держала бы блокировки предыдущих операций всё время backfill'а. Пачки
+    выполняются в отдельном соединении.
+    """
+    with op.get_context().autocommit_block():
+        return backfill(
+            op.get_bind().engine, name, table, values,
+            where=where, batch_size=batch_size, pause=pause,
+        )
+
+
+def create_index_concurrently(index_name: str, table_name: str, columns: Sequence[str], **kw):
+    """CREATE INDEX без блокировки записи: CONCURRENTLY на PostgreSQL.
+
+    Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс; он
+    удаляется, и индекс строится заново. На других СУБД — обычный CREATE INDEX.
+    """
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        op.create_index(index_name, table_name, columns, if_not_exists=True, **kw)
+        return
+
+    with op.get_context().autocommit_block():
+        invalid = bind.scalar(
+            sa.text(
+                "SELECT NOT i.indisvalid FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+            ),
+            {"name": index_name},
+        )
+        if invalid:
+            op.drop_index(index_name, table_name=table_name, postgresql_concurrently=True)
+        op.create_index(
+            index_name, table_name, columns,
+            postgresql_concurrently=True, if_not_exists=True, **kw
+        )
+
+
+def drop_index_concurrently(index_name: str, table_name: str):
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        op.drop_index(index_name, table_name=table_name, if_exists=True)
+        return
+    with op.get_context().autocommit_block():
+        op.drop_index(index_name, table_name=table_name, postgresql_concurrently=True, if_exists=True)
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Literal, Optional
 import warnings
 
 
@@ -7,7 +7,57 @@ class Settings(BaseSettings):
     # Безопасное значение по умолчанию только для разработки
     SECRET_KEY: str = "development-secret-key-do-not-use-in-production"
     DATABASE_URL: str = "sqlite:///./sql_app.db"
-    ACCESS_TOKEN_EXPIRE_HOURS: int = 48
+    # Короткий access-токен проверяется без базы; refresh-токен обменивается на новую пару
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    # Устарело: прежняя настройка срока access-токена в часах. Если задана, а
+    # ACCESS_TOKEN_EXPIRE_MINUTES нет, переводится в минуты
+    ACCESS_TOKEN_EXPIRE_HOURS: Optional[int] = None
+    TOKEN_CACHE_SIZE: int = 10000  # проверенные токены в памяти процесса; 0 — без кеша
+    # Кеш пользователей для проверки токена; на других процессах изменения видны через TTL
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 30
+
+    # Аутентификация: "database" — пользователь из базы (через кеш принципалов),
+    # "stateless" — claims подписанного токена и карта отзыва без запроса к базе
+    AUTH_MODE: Literal["database", "stateless"] = "database"
+    AUTH_REVOCATION_REFRESH_SECONDS: float = 10  # перестройка карты отзыва; 0 — только на старте
+
+    # bcrypt в отдельном пуле: "process" или "thread"; сверх MAX_PENDING операций — 503
+    PASSWORD_HASH_EXECUTOR: Literal["process", "thread"] = "process"
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 16
+
+    # Реплики только для чтения (через запятую) и допустимое отставание от primary
+    DATABASE_REPLICA_URLS: str = ""
+    REPLICA_MAX_LAG_SECONDS: float = 2.0
+
+    # Пул соединений с базой данных
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_ISOLATION_LEVEL: Optional[str] = None  # например "READ COMMITTED"
+
+    # Продакшен-профиль SQLite: WAL, pragmas, отдельные читатели и один писатель
+    SQLITE_PRODUCTION_PROFILE: bool = False
+    SQLITE_MMAP_SIZE: int = 268435456  # 256 MiB
+    SQLITE_CACHE_SIZE: int = -65536  # отрицательное значение — в KiB (64 MiB)
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_READER_POOL_SIZE: int = 8
+
+    # Group commit: записи конкурентных запросов фиксируются одной транзакцией
+    WRITE_COALESCING: bool = False
+    WRITE_BATCH_MAX_OPS: int = 64
+    WRITE_BATCH_MAX_DELAY_MS: float = 2.0
+
+    # Поиск объявлений: "database" — полнотекстовый индекс БД, "memory" — индекс BM25 в памяти процесса
+    SEARCH_BACKEND: Literal["database", "memory"] = "database"
+    SEARCH_INDEX_REFRESH_SECONDS: float = 0  # полная перестройка индекса в памяти; 0 — выключена
+
+    # include_total: до скольких строк выборка считается точно, дальше — оценка
+    EXACT_COUNT_LIMIT: int = 10000
     
     class Config:
         env_file = ".env"
@@ -22,6 +72,14 @@ class Settings(BaseSettings):
                 "Для продакшена установите SECRET_KEY в .env файле.",
                 UserWarning
             )
+        if self.ACCESS_TOKEN_EXPIRE_HOURS is not None:
+            warnings.warn(
+                "ACCESS_TOKEN_EXPIRE_HOURS устарела, используйте ACCESS_TOKEN_EXPIRE_MINUTES "
+                "(вместе с refresh-токенами рекомендуется 15 минут).",
+                UserWarning
+            )
+            if "ACCESS_TOKEN_EXPIRE_MINUTES" not in self.model_fields_set:
+                self.ACCESS_TOKEN_EXPIRE_MINUTES = self.ACCESS_TOKEN_EXPIRE_HOURS * 60
 
 
 settings = Settings()
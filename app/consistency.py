@@ -0,0 +1,64 @@
+import math
+import time
+from typing import Optional
+
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+
+# Токен согласованности: момент последнего commit'а, выданный клиенту после записи.
+# Клиент возвращает его в следующих запросах, и пока реплики могут отставать,
+# его чтения идут на primary (read-your-writes).
+CONSISTENCY_HEADER = "X-Consistency-Token"
+# Допустимое расхождение часов между процессами, выдавшими и читающими токен
+CLOCK_SKEW_SECONDS = 1.0
+
+
+def mark_committed(db: AsyncSession):
+    """Запоминает время commit'а в состоянии запроса, которому принадлежит сессия."""
+    state = db.info.get("request_state")
+    if state is not None:
+        state.consistency_token = f"{time.time():.6f}"
+
+
+def requires_primary(request: Request) -> bool:
+    """True, если клиент недавно писал и реплики могли ещё не догнать primary."""
+    token = request.headers.get(CONSISTENCY_HEADER)
+    if not token:
+        return False
+    try:
+        committed_at = float(token)
+    except ValueError:
+        return False
+    now = time.time()
+    # Токен из будущего (9e99, inf) навсегда привязал бы клиента к primary,
+    # nan не сравнивается ни с чем: такие токены считаем отсутствующими
+    if not math.isfinite(committed_at) or committed_at > now + CLOCK_SKEW_SECONDS:
+        return False
+    return now - committed_at < settings.REPLICA_MAX_LAG_SECONDS
+
+
+class ConsistencyTokenMiddleware:
+    """ASGI middleware: добавляет X-Consistency-Token в ответ, если запрос что-то записал."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+
+        async def send_with_token(message):
+            if message["type"] == "http.response.start":
+                token: Optional[str] = state.get("consistency_token")
+                if token is not None:
+                    headers = list(message.get("headers", []))
+                    headers.append((CONSISTENCY_HEADER.lower().encode(), token.encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_token)
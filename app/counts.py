@@ -0,0 +1,114 @@
+import json
+from typing import List, Optional, Tuple
+
+from sqlalchemy import DDL, column, event, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Общее число строк для листингов (include_total) без полного прохода таблицы.
+#
+# SQLite: счётчики в таблице row_counts, их ведут триггеры на тех же
+# транзакциях, что и изменения строк, — число всегда точное.
+#
+# PostgreSQL: оценка планировщика (pg_class.reltuples), которую обновляют
+# VACUUM и ANALYZE, — число приблизительное. Триггеры не нужны: счётчик в
+# одной строке стал бы точкой конкуренции для всех вставок.
+#
+# Для уже существующих баз тот же DDL выполняет миграция 0006 (своя
+# замороженная копия: изменения здесь её не затрагивают).
+
+ADVERTISEMENTS = "advertisements"
+ACTIVE_USERS = "users_active"
+
+SQLITE_DDL: List[str] = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS advertisements_count_ai AFTER INSERT ON advertisements BEGIN
+        UPDATE row_counts SET count = count + 1 WHERE name = '{ADVERTISEMENTS}';
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS advertisements_count_ad AFTER DELETE ON advertisements BEGIN
+        UPDATE row_counts SET count = count - 1 WHERE name = '{ADVERTISEMENTS}';
+    END
+    """,
+    # Листинг пользователей показывает только активных (is_active = 1)
+    f"""
+    CREATE TRIGGER IF NOT EXISTS users_count_ai AFTER INSERT ON users BEGIN
+        UPDATE row_counts SET count = count + (new.is_active IS 1) WHERE name = '{ACTIVE_USERS}';
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS users_count_ad AFTER DELETE ON users BEGIN
+        UPDATE row_counts SET count = count - (old.is_active IS 1) WHERE name = '{ACTIVE_USERS}';
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS users_count_au AFTER UPDATE OF is_active ON users BEGIN
+        UPDATE row_counts SET count = count + (new.is_active IS 1) - (old.is_active IS 1)
+        WHERE name = '{ACTIVE_USERS}';
+    END
+    """,
+    # Начальные значения для строк, которые уже были в таблицах
+    f"""
+    INSERT OR REPLACE INTO row_counts (name, count)
+    SELECT '{ADVERTISEMENTS}', count(*) FROM advertisements
+    """,
+    f"""
+    INSERT OR REPLACE INTO row_counts (name, count)
+    SELECT '{ACTIVE_USERS}', count(*) FROM users WHERE is_active = 1
+    """,
+]
+
+# Отношение, по которому PostgreSQL оценивает число строк счётчика.
+# Для активных пользователей — частичный индекс ix_users_active_id: в нём
+# ровно активные пользователи
+POSTGRESQL_RELATIONS = {
+    ADVERTISEMENTS: "advertisements",
+    ACTIVE_USERS: "ix_users_active_id",
+}
+
+
+def attach_counter_ddl(metadata):
+    """Создаёт триггеры счётчиков после всех таблиц (create_all).
+
+    Триггеры ссылаются и на row_counts, и на считаемые таблицы, поэтому
+    привязаны к metadata, а не к одной из таблиц.
+    """
+    for statement in SQLITE_DDL:
+        event.listen(metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+
+row_counts = table("row_counts", column("name"), column("count"))
+
+
+async def table_total(db: AsyncSession, name: str) -> Tuple[Optional[int], bool]:
+    """Число строк счётчика name без прохода по таблице: (число, точное ли).
+
+    None — быстрого способа нет (другая СУБД или таблица ещё не
+    анализировалась): вызывающий считает сам.
+    """
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        total = await db.scalar(select(row_counts.c.count).where(row_counts.c.name == name))
+        return total, True
+    if dialect == "postgresql":
+        estimate = await db.scalar(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:relation)"),
+            {"relation": POSTGRESQL_RELATIONS[name]},
+        )
+        # -1 — отношение ещё ни разу не анализировалось
+        if estimate is None or estimate < 0:
+            return None, False
+        return estimate, False
+    return None, False
+
+
+async def planner_estimate(db: AsyncSession, stmt) -> Optional[int]:
+    """Оценка числа строк запроса планировщиком PostgreSQL (EXPLAIN, без выполнения)."""
+    if db.bind.dialect.name != "postgresql":
+        return None
+    compiled = str(stmt.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True}))
+    # Двоеточия в литералах text() принял бы за параметры
+    plan = await db.scalar(text("EXPLAIN (FORMAT JSON) " + compiled.replace(":", "\\:")))
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
@@ -1,116 +1,675 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from . import models, schemas, auth
+import secrets
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, func, insert, lambda_stmt, literal, or_, select, text, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, selectinload
+from . import models, schemas, auth, counts, fulltext, listing, passwords, principals, revocations, rollups, search_index
+from .config import settings
+from .write_queue import execute_write
 from .models import UserGroup  # ✅ Импортируем Enum
 
+# Запросы чтения построены на lambda_stmt: SQLAlchemy кеширует построенный
+# statement и его компиляцию по месту лямбды, а значения из замыкания
+# подставляются как bind-параметры. Повторный вызов не пересобирает запрос.
+
 # User CRUD operations
-def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id, models.User.is_active == True).first()
-
-def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username, models.User.is_active == True).first()
-
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email, models.User.is_active == True).first()
-
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).filter(models.User.is_active == True).offset(skip).limit(limit).all()
-
-def create_user(db: Session, user: schemas.UserCreate):
-    # Проверка существования пользователя с таким username
-    db_user_by_username = get_user_by_username(db, user.username)
-    if db_user_by_username:
-        raise ValueError("Username already registered")
-    
-    # Проверка существования пользователя с таким email
-    db_user_by_email = get_user_by_email(db, user.email)
-    if db_user_by_email:
-        raise ValueError("Email already registered")
-    
-    hashed_password = auth.get_password_hash(user.password)
-    db_user = models.User(
-        username=user.username,
-        email=user.email,
-        hashed_password=hashed_password,
-        group=user.group
+async def get_user(db: AsyncSession, user_id: int):
+    stmt = lambda_stmt(
+        lambda: select(models.User).where(models.User.id == user_id, models.User.is_active == True)
     )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    stmt = lambda_stmt(
+        lambda: select(models.User).where(models.User.username == username, models.User.is_active == True)
+    )
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    stmt = lambda_stmt(
+        lambda: select(models.User).where(models.User.email == email, models.User.is_active == True)
+    )
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    stmt = lambda_stmt(
+        lambda: select(models.User).where(models.User.is_active == True).order_by(models.User.id)
+    )
+    if after_id is not None:
+        # Keyset: продолжаем после id последней строки, а не пропускаем skip строк
+        stmt += lambda s: s.where(models.User.id > after_id)
+    else:
+        stmt += lambda s: s.offset(skip)
+    stmt += lambda s: s.limit(limit)
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+async def get_users_with_total(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    """get_users и общее число активных пользователей: (строки, число, точное ли)."""
+    users = await get_users(db, skip=skip, limit=limit, after_id=after_id)
+    total, exact = await counts.table_total(db, counts.ACTIVE_USERS)
+    if total is None:
+        total, exact = await _capped_count(
+            db, select(models.User.id).where(models.User.is_active == True)
+        )
+    return users, total, exact
+
+async def _page_with_total(
+    db: AsyncSession, model, stmt, order: tuple, skip: int, limit: int, expand: Tuple[str, ...] = ()
+):
+    """Страница выборки и её общее число одним запросом: (строки, число, точное ли).
+
+    Строки выборки нумеруются в порядке order, но не дальше cap + 1-й:
+    count(*) OVER () по ним — точное число, если выборка не больше cap, и
+    признак того, что она больше, иначе. Для больших выборок число — оценка
+    планировщика (PostgreSQL) или нижняя граница cap + 1. expand — имена
+    связей, которые загружаются для страницы через selectinload.
+
+    cap — всегда EXACT_COUNT_LIMIT: клиент параметрами страницы не может
+    заставить сервер считать больше. Страница за cap читается обычным
+    запросом, число — ограниченным подсчётом.
+    """
+    cap = settings.EXACT_COUNT_LIMIT
+    if skip + limit > cap:
+        page = stmt.order_by(*order).offset(skip).limit(limit).options(
+            *(selectinload(getattr(model, name)) for name in expand)
+        )
+        rows = (await db.execute(page)).scalars().all()
+        total, exact = await _capped_count(db, stmt)
+        return rows, total, exact
+    numbered = (
+        stmt.add_columns(func.row_number().over(order_by=order).label("position"))
+        .order_by(*order)
+        .limit(cap + 1)
+        .subquery()
+    )
+    row = aliased(model, numbered)
+    result = await db.execute(
+        select(row, func.count().over())
+        .order_by(numbered.c.position)
+        .offset(skip)
+        .limit(limit)
+        .options(*(selectinload(getattr(row, name)) for name in expand))
+    )
+    pairs = result.all()
+    rows = [pair[0] for pair in pairs]
+    if pairs:
+        total = pairs[0][1]
+    else:
+        # Страница за концом выборки: окну нечего вернуть
+        total = await db.scalar(select(func.count()).select_from(numbered))
+    if total <= cap:
+        return rows, total, True
+    return rows, await _estimate_total(db, stmt, cap), False
+
+async def _capped_count(db: AsyncSession, stmt):
+    """Число строк выборки, но не больше EXACT_COUNT_LIMIT + 1: (число, точное ли)."""
+    cap = settings.EXACT_COUNT_LIMIT
+    total = await db.scalar(select(func.count()).select_from(stmt.limit(cap + 1).subquery()))
+    if total <= cap:
+        return total, True
+    return await _estimate_total(db, stmt, cap), False
+
+async def _estimate_total(db: AsyncSession, stmt, cap: int) -> int:
+    estimate = await counts.planner_estimate(db, stmt)
+    # Выборка точно больше cap, оценка не может быть меньше
+    return max(estimate or 0, cap + 1)
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    # bcrypt блокирует: считается в пуле passwords.py, а не в event loop
+    hashed_password = await passwords.hash_password(user.password)
+
+    async def operation(session: AsyncSession):
+        # Уникальность username/email проверяют уникальные индексы: один INSERT
+        # без предварительных SELECT и без гонки между конкурентными регистрациями.
+        # INSERT ... RETURNING сразу возвращает серверные значения (id, created_at)
+        result = await session.scalars(
+            insert(models.User)
+            .values(
+                username=user.username,
+                email=user.email,
+                hashed_password=hashed_password,
+                group=user.group
+            )
+            .returning(models.User)
+        )
+        return result.one()
+
+    try:
+        return await execute_write(db, operation)
+    except IntegrityError as error:
+        raise ValueError(_registration_conflict(error)) from error
+
+# Ограничение уникальности -> сообщение: имена индексов (PostgreSQL) и
+# столбцов в тексте ошибки SQLite
+REGISTRATION_CONFLICTS = {
+    "ix_users_email": "Email already registered",
+    "users.email": "Email already registered",
+    "ix_users_username": "Username already registered",
+    "users.username": "Username already registered",
+}
+
+def _violated_constraint(error: IntegrityError) -> Optional[str]:
+    # asyncpg: имя ограничения в исходном исключении драйвера. Сам текст
+    # ошибки не разбираем: в DETAIL попадает значение, например username
+    constraint_name = getattr(error.orig.__cause__, "constraint_name", None)
+    if constraint_name:
+        return constraint_name
+    # SQLite: "UNIQUE constraint failed: users.email"
+    prefix = "UNIQUE constraint failed: "
+    message = str(error.orig)
+    if message.startswith(prefix):
+        return message[len(prefix):]
+    return None
+
+def _registration_conflict(error: IntegrityError) -> str:
+    conflict = REGISTRATION_CONFLICTS.get(_violated_constraint(error))
+    if conflict is None:
+        raise error
+    return conflict
 
-def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
-    db_user = get_user(db, user_id)
-    if not db_user:
-        return None
-    
+# Изменения пользователя, после которых выданные токены отзываются
+REVOKING_FIELDS = {"hashed_password", "group", "username"}
+
+async def update_user(db: AsyncSession, user_id: int, user_update: schemas.UserUpdate):
     update_data = user_update.model_dump(exclude_unset=True)
-    
+
     if "password" in update_data:
-        update_data["hashed_password"] = auth.get_password_hash(update_data.pop("password"))
-    
-    for field, value in update_data.items():
-        setattr(db_user, field, value)
-    
-    db.commit()
-    db.refresh(db_user)
+        update_data["hashed_password"] = await passwords.hash_password(update_data.pop("password"))
+    # Выданные токены несут прежние имя и группу или выданы по старому паролю
+    revokes_tokens = bool(REVOKING_FIELDS & update_data.keys())
+
+    async def operation(session: AsyncSession):
+        if not update_data:
+            return await get_user(session, user_id)
+
+        values = dict(update_data)
+        if revokes_tokens:
+            values["token_version"] = models.User.token_version + 1
+        # Один UPDATE ... RETURNING вместо SELECT + UPDATE + SELECT
+        result = await session.scalars(
+            update(models.User)
+            .where(models.User.id == user_id, models.User.is_active == True)
+            .values(**values)
+            .returning(models.User)
+            .execution_options(populate_existing=True)
+        )
+        return result.first()
+
+    db_user = await execute_write(db, operation)
+    # После commit: следующий запрос с токеном пользователя перечитает его из базы
+    principals.invalidate_principal(user_id)
+    if db_user is not None and revokes_tokens:
+        revocations.record_token_version(db_user.id, db_user.token_version)
     return db_user
 
-def delete_user(db: Session, user_id: int):
-    db_user = get_user(db, user_id)
-    if not db_user:
-        return None
-    
-    # Soft delete
-    db_user.is_active = False
-    db.commit()
+async def delete_user(db: AsyncSession, user_id: int):
+    async def operation(session: AsyncSession):
+        # Soft delete
+        result = await session.scalars(
+            update(models.User)
+            .where(models.User.id == user_id, models.User.is_active == True)
+            .values(is_active=False, token_version=models.User.token_version + 1)
+            .returning(models.User)
+            .execution_options(populate_existing=True)
+        )
+        return result.first()
+
+    db_user = await execute_write(db, operation)
+    # Деактивация действует на этом процессе сразу, а не через TTL кеша
+    principals.invalidate_principal(user_id)
+    if db_user is not None:
+        revocations.record_token_version(db_user.id, db_user.token_version)
     return db_user
 
+# Refresh tokens
+def _refresh_token_values(user: models.User, family_id: str) -> Tuple[str, dict]:
+    token = auth.generate_refresh_token()
+    return token, dict(
+        token_hash=auth.hash_refresh_token(token),
+        family_id=family_id,
+        user_id=user.id,
+        token_version=user.token_version,
+        expires_at=datetime.now(timezone.utc) + timedelta(days=auth.REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+
+async def create_refresh_token(db: AsyncSession, user: models.User) -> str:
+    """Выдаёт refresh-токен новой цепочки (при входе); возвращает сам токен.
+
+    В той же транзакции удаляет просроченные токены пользователя (индекс
+    user_id, expires_at): иначе каждый вход навсегда оставлял бы строку.
+    """
+    token, values = _refresh_token_values(user, family_id=secrets.token_hex(16))
+
+    async def operation(session: AsyncSession):
+        await session.execute(
+            delete(models.RefreshToken)
+            .where(models.RefreshToken.user_id == user.id, models.RefreshToken.expires_at < func.now())
+        )
+        await session.execute(insert(models.RefreshToken).values(**values))
+
+    await execute_write(db, operation)
+    return token
+
+async def rotate_refresh_token(db: AsyncSession, token: str) -> Optional[Tuple[models.User, str]]:
+    """Гасит предъявленный refresh-токен и выдаёт следующий той же цепочки.
+
+    Возвращает (пользователь, новый токен) или None, если токен неизвестен,
+    просрочен, уже погашен или выдан до смены пароля, группы или удаления
+    пользователя. Повторное предъявление погашенного токена — признак
+    утечки: гасится вся цепочка, включая токен, выданный взамен.
+    """
+    token_hash = auth.hash_refresh_token(token)
+    refresh_token = models.RefreshToken
+
+    async def operation(session: AsyncSession):
+        # Условие revoked_at IS NULL в самом UPDATE: из двух одновременных
+        # обменов одного токена проходит только один
+        result = await session.execute(
+            update(refresh_token)
+            .where(
+                refresh_token.token_hash == token_hash,
+                refresh_token.revoked_at.is_(None),
+                refresh_token.expires_at > func.now(),
+            )
+            .values(revoked_at=func.now())
+            .returning(refresh_token.family_id, refresh_token.user_id, refresh_token.token_version)
+        )
+        current = result.first()
+        if current is None:
+            reused = (await session.execute(
+                select(refresh_token.family_id)
+                .where(refresh_token.token_hash == token_hash, refresh_token.revoked_at.is_not(None))
+            )).first()
+            if reused is not None:
+                await session.execute(
+                    update(refresh_token)
+                    .where(refresh_token.family_id == reused.family_id, refresh_token.revoked_at.is_(None))
+                    .values(revoked_at=func.now())
+                )
+            return None
+
+        user = await get_user(session, current.user_id)
+        if user is None or user.token_version != current.token_version:
+            return None
+        new_token, values = _refresh_token_values(user, current.family_id)
+        await session.execute(insert(refresh_token).values(**values))
+        return user, new_token
+
+    return await execute_write(db, operation)
+
+async def revoke_refresh_token(db: AsyncSession, token: str):
+    """Выход: гасит цепочку, к которой относится токен."""
+    token_hash = auth.hash_refresh_token(token)
+    refresh_token = models.RefreshToken
+
+    async def operation(session: AsyncSession):
+        family_id = select(refresh_token.family_id).where(refresh_token.token_hash == token_hash)
+        await session.execute(
+            update(refresh_token)
+            .where(refresh_token.family_id == family_id.scalar_subquery(), refresh_token.revoked_at.is_(None))
+            .values(revoked_at=func.now())
+        )
+
+    await execute_write(db, operation)
+
 # Advertisement CRUD operations
-def get_advertisement(db: Session, advertisement_id: int):
-    return db.query(models.Advertisement).filter(models.Advertisement.id == advertisement_id).first()
+async def get_advertisement(db: AsyncSession, advertisement_id: int, expand_owner: bool = False):
+    stmt = lambda_stmt(
+        lambda: select(models.Advertisement).where(models.Advertisement.id == advertisement_id)
+    )
+    if expand_owner:
+        stmt += lambda s: s.options(selectinload(models.Advertisement.owner))
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+async def get_advertisements(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    search: str = None,
+    filters: Optional[schemas.AdvertisementFilters] = None,
+    sort: str = "id",
+    descending: bool = False,
+    after: Optional[Tuple[Any, int]] = None,
+    expand_owner: bool = False
+):
+    """Листинг объявлений с фильтрами и сортировкой.
+
+    Сочетание filters/sort должно быть проверено listing.plan_listing: тогда
+    запрос — диапазон одного индекса. after — (значение ключа сортировки, id)
+    последней строки предыдущей страницы, keyset вместо OFFSET. expand_owner —
+    владельцы всей страницы загружаются вторым запросом (selectinload).
+    """
+    if search:
+        return await _search_advertisements(db, search, skip=skip, limit=limit, expand_owner=expand_owner)
+
+    # Обычный select, а не lambda_stmt: условия и ключ сортировки — выражения,
+    # собранные на этот вызов, и lambda_stmt считал бы для них ключ кеша каждый
+    # раз. Скомпилированный SQL кешируется и так
+    key = listing.SORT_COLUMNS[sort]
+    stmt = select(models.Advertisement).where(*_listing_conditions(filters))
 
-def get_advertisements(db: Session, skip: int = 0, limit: int = 100, search: str = None):
-    query = db.query(models.Advertisement)
-    
+    if after is not None:
+        # Keyset: продолжаем после (ключ, id) последней строки, а не пропускаем
+        # skip строк — стоимость страницы не зависит от её номера
+        after_value, after_id = after
+        if sort == "id":
+            position, boundary = models.Advertisement.id, after_id
+        else:
+            # Значение привязываем с типом колонки: у created_at в SQLite свой формат хранения
+            position = tuple_(key, models.Advertisement.id)
+            boundary = tuple_(literal(after_value, key.type), after_id)
+        stmt = stmt.where(position < boundary if descending else position > boundary)
+    else:
+        stmt = stmt.offset(skip)
+
+    stmt = stmt.order_by(*_listing_order(sort, descending)).limit(limit)
+    if expand_owner:
+        stmt = stmt.options(selectinload(models.Advertisement.owner))
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+async def get_advertisements_with_total(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    search: str = None,
+    filters: Optional[schemas.AdvertisementFilters] = None,
+    sort: str = "id",
+    descending: bool = False,
+    after: Optional[Tuple[Any, int]] = None,
+    expand_owner: bool = False
+):
+    """get_advertisements и общее число выборки: (строки, число, точное ли).
+
+    Первая страница выборки с фильтрами или поиском считается тем же
+    запросом (оконная функция). Без фильтров и на страницах по курсору число
+    берётся из счётчика таблицы или считается отдельным ограниченным запросом.
+    """
     if search:
-        search_filter = or_(
-            models.Advertisement.title.ilike(f"%{search}%"),
-            models.Advertisement.description.ilike(f"%{search}%")
+        if _uses_search_index(search):
+            ids, total = search_index.index.search(search, skip=skip, limit=limit)
+            return await _get_advertisements_by_ids(db, ids, expand_owner), total, True
+        stmt, order = _search_statement(db, search)
+        return await _page_with_total(
+            db, models.Advertisement, stmt, order, skip, limit, expand=_owner_expansion(expand_owner)
+        )
+
+    conditions = _listing_conditions(filters)
+    if conditions and after is None:
+        stmt = select(models.Advertisement).where(*conditions)
+        order = _listing_order(sort, descending)
+        return await _page_with_total(
+            db, models.Advertisement, stmt, order, skip, limit, expand=_owner_expansion(expand_owner)
+        )
+
+    advertisements = await get_advertisements(
+        db, skip=skip, limit=limit, filters=filters, sort=sort, descending=descending, after=after,
+        expand_owner=expand_owner
+    )
+    total = None
+    if not conditions:
+        total, exact = await counts.table_total(db, counts.ADVERTISEMENTS)
+    if total is None:
+        total, exact = await _capped_count(
+            db, select(models.Advertisement.id).where(*conditions)
+        )
+    return advertisements, total, exact
+
+def _listing_conditions(filters: Optional[schemas.AdvertisementFilters]) -> list:
+    conditions = []
+    if filters is None:
+        return conditions
+    if filters.owner_id is not None:
+        conditions.append(models.Advertisement.owner_id == filters.owner_id)
+    if filters.price_min is not None:
+        conditions.append(models.Advertisement.price >= filters.price_min)
+    if filters.price_max is not None:
+        conditions.append(models.Advertisement.price <= filters.price_max)
+    if filters.created_after is not None:
+        conditions.append(models.Advertisement.created_at >= filters.created_after)
+    if filters.created_before is not None:
+        conditions.append(models.Advertisement.created_at < filters.created_before)
+    return conditions
+
+def _listing_order(sort: str, descending: bool) -> tuple:
+    key = listing.SORT_COLUMNS[sort]
+    if sort == "id":
+        return (models.Advertisement.id.desc(),) if descending else (models.Advertisement.id,)
+    if descending:
+        return (key.desc(), models.Advertisement.id.desc())
+    return (key, models.Advertisement.id)
+
+def _owner_expansion(expand_owner: bool) -> Tuple[str, ...]:
+    return ("owner",) if expand_owner else ()
+
+async def _search_advertisements(
+    db: AsyncSession, search: str, skip: int, limit: int, expand_owner: bool = False
+):
+    """Полнотекстовый поиск, результаты по убыванию релевантности.
+
+    Порядок задаёт релевантность, а не id, поэтому страницы считаются через
+    offset. При SEARCH_BACKEND=memory ранжирует индекс в памяти процесса, из
+    базы объявления читаются по первичному ключу. Для СУБД без
+    полнотекстового индекса остаётся ILIKE.
+    """
+    if _uses_search_index(search):
+        ids, _ = search_index.index.search(search, skip=skip, limit=limit)
+        return await _get_advertisements_by_ids(db, ids, expand_owner)
+
+    stmt, order = _search_statement(db, search)
+    stmt = stmt.order_by(*order).offset(skip).limit(limit)
+    if expand_owner:
+        stmt = stmt.options(selectinload(models.Advertisement.owner))
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+def _uses_search_index(search: str) -> bool:
+    return search_index.index is not None and bool(search_index.tokenize(search))
+
+def _search_statement(db: AsyncSession, search: str):
+    """Запрос поиска без сортировки и сортировка по релевантности для текущей СУБД.
+
+    Обычный select, а не lambda_stmt: форма запроса зависит от СУБД и от того,
+    есть ли в строке слова; скомпилированный SQL всё равно кешируется.
+    """
+    dialect = db.bind.dialect.name
+    match = fulltext.fts5_query(search)
+
+    if dialect == "sqlite" and match:
+        # rank в FTS5 — это bm25: чем меньше, тем релевантнее
+        stmt = (
+            select(models.Advertisement)
+            .join(fulltext.fts, fulltext.fts.c.rowid == models.Advertisement.id)
+            .where(fulltext.fts.c.advertisements_fts.match(match))
+        )
+        return stmt, (fulltext.fts.c.rank, models.Advertisement.id)
+    if dialect == "postgresql":
+        query = fulltext.pg_tsquery(search)
+        stmt = select(models.Advertisement).where(fulltext.search_vector.op("@@")(query))
+        return stmt, (func.ts_rank_cd(fulltext.search_vector, query).desc(), models.Advertisement.id)
+
+    pattern = f"%{search}%"
+    stmt = select(models.Advertisement).where(
+        or_(
+            models.Advertisement.title.ilike(pattern),
+            models.Advertisement.description.ilike(pattern)
         )
-        query = query.filter(search_filter)
-    
-    return query.offset(skip).limit(limit).all()
-
-def create_advertisement(db: Session, advertisement: schemas.AdvertisementCreate, owner_id: int):
-    db_advertisement = models.Advertisement(
-        **advertisement.model_dump(),
-        owner_id=owner_id
     )
-    db.add(db_advertisement)
-    db.commit()
-    db.refresh(db_advertisement)
+    return stmt, (models.Advertisement.id,)
+
+async def _get_advertisements_by_ids(db: AsyncSession, ids: List[int], expand_owner: bool = False):
+    """Объявления в порядке переданных id (порядок релевантности)."""
+    if not ids:
+        return []
+    stmt = lambda_stmt(
+        lambda: select(models.Advertisement).where(models.Advertisement.id.in_(ids))
+    )
+    if expand_owner:
+        stmt += lambda s: s.options(selectinload(models.Advertisement.owner))
+    result = await db.execute(stmt)
+    by_id = {advertisement.id: advertisement for advertisement in result.scalars()}
+    return [by_id[advertisement_id] for advertisement_id in ids if advertisement_id in by_id]
+
+async def create_advertisement(db: AsyncSession, advertisement: schemas.AdvertisementCreate, owner_id: int):
+    async def operation(session: AsyncSession):
+        result = await session.scalars(
+            insert(models.Advertisement)
+            .values(**advertisement.model_dump(), owner_id=owner_id)
+            .returning(models.Advertisement)
+        )
+        db_advertisement = result.one()
+        # Сводки меняются в той же транзакции, что и объявление
+        await rollups.advertisement_created(
+            session, db_advertisement.owner_id, db_advertisement.created_at, db_advertisement.price
+        )
+        return db_advertisement
+
+    db_advertisement = await execute_write(db, operation)
+    # Индекс в памяти обновляем только после commit
+    search_index.index_advertisement(db_advertisement)
     return db_advertisement
 
-def update_advertisement(db: Session, advertisement_id: int, advertisement_update: schemas.AdvertisementUpdate):
-    db_advertisement = get_advertisement(db, advertisement_id)
-    if not db_advertisement:
-        return None
-    
+async def _advertisement_exists(session: AsyncSession, advertisement_id: int) -> bool:
+    stmt = lambda_stmt(
+        lambda: select(models.Advertisement.id).where(models.Advertisement.id == advertisement_id)
+    )
+    return (await session.execute(stmt)).first() is not None
+
+async def update_advertisement(
+    db: AsyncSession,
+    advertisement_id: int,
+    advertisement_update: schemas.AdvertisementUpdate,
+    owner_id: Optional[int] = None
+):
+    """Обновляет объявление одним UPDATE ... RETURNING.
+
+    Если передан owner_id, условие владения входит в сам UPDATE (owner_id=None —
+    без ограничения, для администраторов). Возвращает None, если объявления нет,
+    и бросает PermissionError, если оно принадлежит другому пользователю.
+    """
     update_data = advertisement_update.model_dump(exclude_unset=True)
-    
-    for field, value in update_data.items():
-        setattr(db_advertisement, field, value)
-    
-    db.commit()
-    db.refresh(db_advertisement)
+
+    async def operation(session: AsyncSession):
+        if not update_data:
+            db_advertisement = await get_advertisement(session, advertisement_id)
+            if db_advertisement and owner_id is not None and db_advertisement.owner_id != owner_id:
+                raise PermissionError("Not enough permissions")
+            return db_advertisement
+
+        stmt = update(models.Advertisement).where(models.Advertisement.id == advertisement_id)
+        if owner_id is not None:
+            stmt = stmt.where(models.Advertisement.owner_id == owner_id)
+        stmt = stmt.values(**update_data).execution_options(populate_existing=True)
+
+        old_price = None
+        if "price" not in update_data:
+            result = await session.scalars(stmt.returning(models.Advertisement))
+            db_advertisement = result.first()
+        elif session.bind.dialect.name == "postgresql":
+            # Сводкам нужна прежняя цена, а RETURNING отдаёт новые значения:
+            # берём её из заблокированной строки в том же UPDATE ... FROM.
+            # FOR UPDATE — чтобы под конкурентным UPDATE это была именно
+            # заменяемая цена, а не значение из снимка начала запроса
+            old = (
+                select(models.Advertisement.id, models.Advertisement.price)
+                .where(models.Advertisement.id == advertisement_id)
+                .with_for_update()
+                .cte("old")
+            )
+            row = (await session.execute(
+                stmt.where(models.Advertisement.id == old.c.id)
+                .returning(models.Advertisement, old.c.price)
+            )).first()
+            db_advertisement, old_price = row if row is not None else (None, None)
+        else:
+            # SQLite не даёт сослаться в RETURNING на другие таблицы, поэтому
+            # прежняя цена читается отдельно. SELECT в отложенной транзакции
+            # блокировки не берёт, и конкурентные PATCH прочитали бы одну и ту
+            # же цену. Холостой UPDATE (text(): без onupdate для updated_at)
+            # сначала берёт блокировку записи: другие писатели ждут commit
+            await session.execute(
+                text("UPDATE advertisements SET price = price WHERE id = :id"), {"id": advertisement_id}
+            )
+            old_price = await session.scalar(
+                select(models.Advertisement.price).where(models.Advertisement.id == advertisement_id)
+            )
+            result = await session.scalars(stmt.returning(models.Advertisement))
+            db_advertisement = result.first()
+
+        # Строка не затронута: различаем «нет объявления» и «чужое объявление»
+        if db_advertisement is None and owner_id is not None:
+            if await _advertisement_exists(session, advertisement_id):
+                raise PermissionError("Not enough permissions")
+        if db_advertisement is not None and old_price is not None:
+            await rollups.advertisement_repriced(
+                session, db_advertisement.owner_id, db_advertisement.created_at,
+                old_price, db_advertisement.price
+            )
+        return db_advertisement
+
+    db_advertisement = await execute_write(db, operation)
+    if db_advertisement is not None:
+        search_index.index_advertisement(db_advertisement)
     return db_advertisement
 
-def delete_advertisement(db: Session, advertisement_id: int) -> bool:  # ✅ Явная аннотация
-    db_advertisement = get_advertisement(db, advertisement_id)
-    if not db_advertisement:
+async def delete_advertisement(
+    db: AsyncSession,
+    advertisement_id: int,
+    owner_id: Optional[int] = None
+) -> bool:  # ✅ Явная аннотация
+    """Удаляет объявление одним DELETE ... RETURNING; owner_id — как в update_advertisement."""
+    async def operation(session: AsyncSession):
+        stmt = delete(models.Advertisement).where(models.Advertisement.id == advertisement_id)
+        if owner_id is not None:
+            stmt = stmt.where(models.Advertisement.owner_id == owner_id)
+        result = await session.execute(stmt.returning(
+            models.Advertisement.owner_id, models.Advertisement.created_at, models.Advertisement.price
+        ))
+        deleted = result.first()
+        if deleted is not None:
+            await rollups.advertisement_deleted(session, deleted.owner_id, deleted.created_at, deleted.price)
+            return True  # ✅ Возвращаем булево значение
+        if owner_id is not None and await _advertisement_exists(session, advertisement_id):
+            raise PermissionError("Not enough permissions")
         return False
-    
-    db.delete(db_advertisement)
-    db.commit()
-    return True  # ✅ Возвращаем булево значение
\ No newline at end of file
+
+    deleted = await execute_write(db, operation)
+    if deleted:
+        search_index.remove_advertisement(advertisement_id)
+    return deleted
+
+# Statistics: чтение сводок (rollups.py) по первичному ключу
+async def get_owner_stats(db: AsyncSession, owner_id: int):
+    stmt = lambda_stmt(
+        lambda: select(models.OwnerAdvertisementStats)
+        .where(models.OwnerAdvertisementStats.owner_id == owner_id)
+    )
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+async def get_owners_stats(db: AsyncSession, skip: int = 0, limit: int = 100):
+    stmt = lambda_stmt(
+        lambda: select(models.OwnerAdvertisementStats)
+        .order_by(models.OwnerAdvertisementStats.owner_id)
+        .offset(skip)
+        .limit(limit)
+    )
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+async def get_daily_stats(db: AsyncSession, date_from: date, date_to: date):
+    """Сводки по дням от date_from до date_to включительно."""
+    stmt = lambda_stmt(
+        lambda: select(models.DailyAdvertisementStats)
+        .where(models.DailyAdvertisementStats.day >= date_from, models.DailyAdvertisementStats.day <= date_to)
+        .order_by(models.DailyAdvertisementStats.day)
+    )
+    result = await db.execute(stmt)
+    return result.scalars().all()
@@ -1,19 +1,353 @@
-from sqlalchemy import create_engine
+import itertools
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from alembic.script import ScriptDirectory
+from alembic.util import CommandError
+from fastapi import Depends, Request
+
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from .config import settings
+from .consistency import requires_primary
+
+logger = logging.getLogger(__name__)
+
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
+
+# Драйверы для асинхронного режима: aiosqlite для SQLite, asyncpg для PostgreSQL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+def make_async_url(url: str) -> str:
+    """Переводит синхронный URL (sqlite://, postgresql://) на асинхронный драйвер."""
+    scheme, sep, rest = url.partition("://")
+    backend = scheme.split("+", 1)[0]
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Unsupported database backend: {backend}")
+    return f"{ASYNC_DRIVERS[backend]}{sep}{rest}"
+
+
+class PoolStats:
+    """Накопительная статистика ожидания соединений из пула."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited: float):
+        self.checkouts += 1
+        self.wait_total += waited
+        if waited > self.wait_max:
+            self.wait_max = waited
+
+
+# Статистика по имени пула: переживает пересоздание пула при engine.dispose()
+pool_stats: Dict[str, PoolStats] = {}
+engines: Dict[str, AsyncEngine] = {}
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """QueuePool, который замеряет время ожидания свободного соединения.
+
+    Статистика пишется в pool_stats[stats_name]; имя задаёт
+    instrumented_pool_class для каждого engine.
+    """
+
+    stats_name = "primary"
+
+    def connect(self):
+        stats = pool_stats.setdefault(self.stats_name, PoolStats())
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            stats.timeouts += 1
+            raise
+        finally:
+            stats.record(time.perf_counter() - started)
+
+
+def instrumented_pool_class(name: str) -> type:
+    """InstrumentedQueuePool с именем статистики name.
+
+    create_engine принимает только класс пула, без своих аргументов
+    конструктора, поэтому имя задаётся атрибутом подкласса. Подкласс
+    сохраняется и при пересоздании пула (engine.dispose() -> recreate()).
+    """
+    return type(InstrumentedQueuePool.__name__, (InstrumentedQueuePool,), {"stats_name": name})
+
+
+def create_engine_from_settings(url: str, name: str = "primary", **overrides) -> AsyncEngine:
+    """Создаёт async engine с параметрами пула из Settings.
+
+    ``overrides`` позволяют переопределить отдельные параметры пула
+    (например, ``pool_size``) для конкретного engine.
+    """
+    async_url = make_async_url(url)
+    options = {}
+    if make_url(async_url).database not in (None, "", ":memory:"):
+        options.update(
+            poolclass=instrumented_pool_class(name),
+            pool_logging_name=name,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+    if settings.DB_ISOLATION_LEVEL:
+        options["isolation_level"] = settings.DB_ISOLATION_LEVEL
+    options.update(overrides)
+
+    new_engine = create_async_engine(async_url, **options)
+    engines[name] = new_engine
+    pool_stats.setdefault(name, PoolStats())
+    return new_engine
+
+
+def get_pool_stats() -> Dict[str, dict]:
+    """Текущее состояние пулов: занятые соединения, overflow и время ожидания."""
+    result = {}
+    for name, db_engine in engines.items():
+        pool = db_engine.pool
+        stats = pool_stats.get(name, PoolStats())
+        entry = {
+            "pool_class": type(pool).__name__,
+            "checkouts": stats.checkouts,
+            "timeouts": stats.timeouts,
+            "wait_avg_ms": round(stats.wait_total / stats.checkouts * 1000, 3) if stats.checkouts else 0.0,
+            "wait_max_ms": round(stats.wait_max * 1000, 3),
+        }
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            entry.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=max(pool.overflow(), 0),
+            )
+        result[name] = entry
+    return result
+
+
+async def dispose_engines():
+    """Закрывает соединения всех созданных engine (вызывается при остановке)."""
+    for db_engine in engines.values():
+        await db_engine.dispose()
+
+
+def apply_sqlite_pragmas(dbapi_connection, read_only: bool = False):
+    """Настройки продакшен-профиля SQLite, применяемые к каждому новому соединению."""
+    pragmas = [
+        f"PRAGMA busy_timeout = {settings.SQLITE_BUSY_TIMEOUT_MS}",
+        "PRAGMA synchronous = NORMAL",
+        f"PRAGMA mmap_size = {settings.SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size = {settings.SQLITE_CACHE_SIZE}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+    else:
+        # journal_mode хранится в самом файле БД, его достаточно выставить писателю
+        pragmas.insert(0, "PRAGMA journal_mode = WAL")
+
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in pragmas:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+def configure_sqlite_writer(writer: AsyncEngine):
+    @event.listens_for(writer.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection)
+        # Отключаем неявный BEGIN драйвера, транзакцию открываем сами (см. ниже)
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(writer.sync_engine, "begin")
+    def _on_begin(conn):
+        # Сразу берём RESERVED-блокировку: без "database is locked" при апгрейде чтения в запись
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def configure_sqlite_reader(reader: AsyncEngine):
+    @event.listens_for(reader.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, read_only=True)
+
+
+is_sqlite = make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() == "sqlite"
+
+if is_sqlite and settings.SQLITE_PRODUCTION_PROFILE:
+    # Один писатель и пул читателей: в WAL-режиме чтения не ждут записи
+    engine = create_engine_from_settings(
+        SQLALCHEMY_DATABASE_URL, name="writer", pool_size=1, max_overflow=0
+    )
+    read_engine = create_engine_from_settings(
+        SQLALCHEMY_DATABASE_URL, name="reader", pool_size=settings.SQLITE_READER_POOL_SIZE
+    )
+    configure_sqlite_writer(engine)
+    configure_sqlite_reader(read_engine)
+else:
+    engine = create_engine_from_settings(SQLALCHEMY_DATABASE_URL)
+    read_engine = engine
+
+replica_urls = [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+replica_engines = [
+    create_engine_from_settings(url, name=f"replica{index}")
+    for index, url in enumerate(replica_urls, start=1)
+]
+for replica_engine in replica_engines:
+    if replica_engine.dialect.name == "sqlite":
+        # Локальная копия SQLite вместо реплики: только чтение
+        configure_sqlite_reader(replica_engine)
+
+# expire_on_commit=False: после commit в async-режиме нельзя лениво перечитывать атрибуты
+SessionLocal = async_sessionmaker(
+    bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReplicaSessionLocals = [
+    async_sessionmaker(bind=replica_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    for replica_engine in replica_engines
+]
+_next_replica = itertools.cycle(ReplicaSessionLocals) if ReplicaSessionLocals else None
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+# Каталог миграций Alembic рядом с пакетом приложения (script_location в alembic.ini)
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "alembic"
+
+
+async def check_schema_revision():
+    """Проверяет, что база мигрирована не ниже ревизии кода (alembic upgrade head).
+
+    Ожидаемая ревизия берётся из файлов миграций, а не из константы. Ревизия
+    базы, которой нет среди этих файлов, считается более новой: при rolling
+    deploy миграции применяются до перезапуска старых процессов.
+    """
+    script = ScriptDirectory(str(MIGRATIONS_DIR))
+    head = script.get_current_head()
+    async with engine.connect() as conn:
+        try:
+            current = await conn.scalar(text("SELECT version_num FROM alembic_version"))
+        except exc.DBAPIError:
+            current = None
+    if current == head:
+        return
+    try:
+        known = current is not None and script.get_revision(current) is not None
+    except CommandError:
+        known = False
+    if current is None or known:
+        raise RuntimeError(
+            f"Database schema revision is {current or 'missing'}, expected {head}: "
+            "run 'alembic upgrade head'"
+        )
+    logger.warning("database schema revision %s is newer than code head %s", current, head)
+
+
+class LazySession:
+    """Ленивый прокси над AsyncSession.
+
+    Сессия создаётся при первом обращении, соединение берётся из пула только
+    на первом запросе к БД. Чтение вне явной транзакции сразу завершает свою
+    транзакцию, и соединение возвращается в пул, а не держится до отправки
+    ответа. Записи фиксируются через execute_write, после чего соединение
+    также освобождается.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker, info: Optional[dict] = None):
+        self._session_factory = session_factory
+        self._session: Optional[AsyncSession] = None
+        self.info = info if info is not None else {}
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._session_factory(info=self.info)
+        return self._session
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def in_transaction(self) -> bool:
+        return self._session is not None and self._session.in_transaction()
+
+    async def _read(self, method, *args, **kwargs):
+        session = self.session
+        started_transaction = not session.in_transaction()
+        # AsyncSession возвращает уже буферизованный результат, поэтому
+        # транзакцию можно закрыть сразу после запроса
+        result = await method(*args, **kwargs)
+        if started_transaction and not (session.new or session.dirty or session.deleted):
+            await session.commit()
+        return result
+
+    async def execute(self, *args, **kwargs):
+        return await self._read(self.session.execute, *args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return await self._read(self.session.scalar, *args, **kwargs)
+
+    async def scalars(self, *args, **kwargs):
+        return await self._read(self.session.scalars, *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return await self._read(self.session.get, *args, **kwargs)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+async def get_db(request: Request):
+    # Через состояние запроса запись выдаёт клиенту токен согласованности
+    db = LazySession(SessionLocal, info={"request_state": request.state})
+    try:
+        yield db
+    finally:
+        await db.close()
+
+def choose_read_sessionmaker(request: Request) -> Optional[async_sessionmaker]:
+    """Выбирает, откуда читать; None означает «сессия primary этого запроса»."""
+    if _next_replica is not None:
+        if requires_primary(request):
+            return None
+        return next(_next_replica)
+    if read_engine is not engine:
+        # Читатели SQLite видят тот же файл, что и писатель: отставания нет
+        return ReadSessionLocal
+    return None
+
+async def get_read_db(request: Request, primary_db: LazySession = Depends(get_db)):
+    """Сессия только для чтения: реплика, пул читателей SQLite или primary.
+
+    Сессия primary ленивая и без запросов не занимает соединение, поэтому
+    зависимость от get_db ничего не стоит, когда чтение идёт на реплику.
+    Так запрос никогда не держит два соединения из одного пула.
+    """
+    session_factory = choose_read_sessionmaker(request)
+    if session_factory is None:
+        yield primary_db
+        return
+    db = LazySession(session_factory)
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
@@ -1,24 +1,35 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional
-from . import auth, crud
-from .database import get_db
+from . import auth, crud, principals, revocations, schemas
+from .config import settings
+from .database import get_read_db
 from .models import UserGroup  # ✅ Импортируем Enum
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 security = HTTPBearer()
 
-def get_current_user(
+async def get_current_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     if credentials is None:
         return None
     
     token_data = auth.verify_token(credentials.credentials)
-    user = crud.get_user(db, user_id=token_data.user_id)
+    if settings.AUTH_MODE == "stateless":
+        return _principal_from_token(token_data)
+
+    # Принципал из кеша процесса; в базу — только при промахе
+    user = principals.get_principal(token_data.user_id)
+    if user is None:
+        generation = principals.generation()
+        db_user = await crud.get_user(db, user_id=token_data.user_id)
+        if db_user is not None:
+            user = schemas.Principal.model_validate(db_user)
+            principals.put_principal(user, generation)
     
-    if user is None or not user.is_active:
+    if user is None or not user.is_active or token_data.token_version < user.token_version:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found or inactive",
@@ -26,12 +37,31 @@ def get_current_user(
     
     return user
 
-def check_permissions(
+def _principal_from_token(token_data: schemas.TokenData) -> schemas.Principal:
+    """Принципал из подписанных claims токена, без запроса к базе.
+
+    Токен пользователя, сменившего пароль, группу или имя или удалённого,
+    отклоняется по карте отзыва (revocations.py).
+    """
+    if token_data.group is None or revocations.is_revoked(token_data.user_id, token_data.token_version):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+        )
+    return schemas.Principal(
+        id=token_data.user_id,
+        username=token_data.username,
+        group=token_data.group,
+        is_active=True,
+        token_version=token_data.token_version,
+    )
+
+async def check_permissions(
     user_id: Optional[int] = None,
     advertisement_id: Optional[int] = None,
     required_group: UserGroup = None,  # ✅ Используем Enum тип
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     # Если не требуется аутентификация для эндпоинта
     if current_user is None:
@@ -53,7 +83,7 @@ def check_permissions(
     
     # Проверяем, пытается ли пользователь получить доступ к своему объявлению
     if advertisement_id:
-        advertisement = crud.get_advertisement(db, advertisement_id)
+        advertisement = await crud.get_advertisement(db, advertisement_id)
         if advertisement and advertisement.owner_id != current_user.id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -69,13 +99,26 @@ def check_permissions(
     
     return current_user
 
-def get_optional_user(
+async def require_admin(current_user = Depends(get_current_user)):
+    if current_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Authentication required",
+        )
+    if current_user.group != UserGroup.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions",
+        )
+    return current_user
+
+async def get_optional_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
         if credentials is None:
             return None
-        return get_current_user(credentials, db)
+        return await get_current_user(credentials, db)
     except HTTPException:
         return None
\ No newline at end of file
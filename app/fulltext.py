@@ -0,0 +1,94 @@
+import re
+from typing import List
+
+from sqlalchemy import DDL, column, event, func, literal_column, table
+
+# Полнотекстовый поиск по объявлениям.
+#
+# SQLite: FTS5-таблица с внешним содержимым (content='advertisements'), её
+# синхронизируют триггеры. Стеммер porter — английский; для русского слов
+# FTS5 стеммера не имеет, поэтому каждое слово запроса ищется как префикс.
+#
+# PostgreSQL: генерируемая колонка search_vector (русская и английская
+# морфология) и GIN-индекс по ней. В ORM-модель колонка не входит.
+#
+# Для уже существующих баз тот же DDL выполняет миграция 0002 (своя
+# замороженная копия: изменения здесь её не затрагивают).
+
+FTS_TABLE = "advertisements_fts"
+
+SQLITE_DDL: List[str] = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description,
+        content='advertisements', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS advertisements_fts_ai AFTER INSERT ON advertisements BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS advertisements_fts_ad AFTER DELETE ON advertisements BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS advertisements_fts_au AFTER UPDATE OF title, description ON advertisements BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    # Индексирует строки, которые уже были в таблице
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+POSTGRESQL_DDL: List[str] = [
+    """
+    ALTER TABLE advertisements ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_advertisements_search_vector ON advertisements USING gin (search_vector)",
+]
+
+
+def attach_fulltext_ddl(advertisements_table):
+    """Создаёт поисковый индекс вместе с таблицей объявлений (create_all)."""
+    for statement in SQLITE_DDL:
+        event.listen(advertisements_table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    for statement in POSTGRESQL_DDL:
+        event.listen(advertisements_table, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+
+# Объекты для запросов: FTS-таблица и колонка, которой нет в модели
+fts = table(FTS_TABLE, column("rowid"), column(FTS_TABLE), column("rank"))
+search_vector = literal_column("advertisements.search_vector")
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def fts5_query(search: str) -> str:
+    """Запрос FTS5 из пользовательской строки: все слова, каждое как префикс.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 (OR, NEAR, -) из ввода
+    не интерпретируются.
+    """
+    return " ".join(f'"{word}"*' for word in _WORD.findall(search.lower()))
+
+
+def pg_tsquery(search: str):
+    """tsquery по обоим словарям: слово находится в любой из морфологий."""
+    return func.websearch_to_tsquery(literal_column("'russian'::regconfig"), search).op("||")(
+        func.websearch_to_tsquery(literal_column("'english'::regconfig"), search)
+    )
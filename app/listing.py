@@ -0,0 +1,59 @@
+from typing import FrozenSet, Optional, Tuple
+
+from . import models, schemas
+
+# Сортировки листинга объявлений и индексы, которые отдают строки уже в нужном
+# порядке. id добавлен во все ключи: порядок полный, по нему работает keyset.
+SORT_COLUMNS = {
+    "id": models.Advertisement.id,  # первичный ключ
+    "price": models.Advertisement.price,  # ix_advertisements_price_id
+    "created_at": models.Advertisement.created_at,  # ix_advertisements_created_at_id
+}
+
+# Допустимые сочетания фильтров и сортировок: каждое обслуживается диапазоном
+# одного индекса, поэтому ни один разрешённый запрос не читает всю таблицу.
+# Первая сортировка в списке — сортировка по умолчанию для этих фильтров.
+ALLOWED_PLANS = {
+    frozenset(): ("id", "price", "created_at"),
+    frozenset({"price"}): ("price",),  # (price, id)
+    frozenset({"created_at"}): ("created_at",),  # (created_at, id)
+    frozenset({"owner_id"}): ("created_at",),  # (owner_id, created_at, id)
+    frozenset({"owner_id", "created_at"}): ("created_at",),  # (owner_id, created_at, id)
+}
+
+
+def used_filters(filters: schemas.AdvertisementFilters) -> FrozenSet[str]:
+    used = set()
+    if filters.price_min is not None or filters.price_max is not None:
+        used.add("price")
+    if filters.created_after is not None or filters.created_before is not None:
+        used.add("created_at")
+    if filters.owner_id is not None:
+        used.add("owner_id")
+    return frozenset(used)
+
+
+def plan_listing(filters: schemas.AdvertisementFilters, sort: Optional[str]) -> Tuple[str, bool]:
+    """Проверяет сочетание фильтров и сортировки; возвращает (ключ, по убыванию).
+
+    sort — имя ключа, с префиксом "-" для сортировки по убыванию. Сочетание,
+    не покрытое индексом, — ValueError с перечнем допустимых сортировок.
+    """
+    used = used_filters(filters)
+    allowed = ALLOWED_PLANS.get(used)
+    if allowed is None:
+        raise ValueError(
+            f"Unsupported filter combination: {', '.join(sorted(used))}"
+        )
+    if sort is None:
+        return allowed[0], False
+
+    descending = sort.startswith("-")
+    key = sort.lstrip("-")
+    if key not in SORT_COLUMNS:
+        raise ValueError(f"Unknown sort key: {key}")
+    if key not in allowed:
+        raise ValueError(
+            f"Sort by {key} is not supported with these filters, use one of: {', '.join(allowed)}"
+        )
+    return key, descending
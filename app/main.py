@@ -1,7 +1,17 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
-from .database import engine, Base
-from .routers import users, advertisements, auth
+from .auth import get_token_cache_stats
+from .consistency import ConsistencyTokenMiddleware
+from .passwords import (
+    PasswordHasherBusy, get_password_hasher_stats, start_password_hasher, stop_password_hasher
+)
+from .principals import get_principal_cache_stats
+from .revocations import get_revocation_stats, start_revocations, stop_revocations
+from .database import read_engine, SessionLocal, check_schema_revision, dispose_engines, get_pool_stats
+from .search_index import get_search_index_stats, start_search_index, stop_search_index
+from .write_queue import get_write_queue_stats, start_write_coalescer, stop_write_coalescer
+from .routers import users, advertisements, auth, stats
 import warnings
 
 @asynccontextmanager
@@ -15,11 +25,29 @@ async def lifespan(app: FastAPI):
             UserWarning
         )
     
-    # Создание таблиц на старте
-    Base.metadata.create_all(bind=engine)
+    # Схемой управляет Alembic: на старте только сверяем ревизию
+    try:
+        await check_schema_revision()
+    except RuntimeError:
+        # Иначе открытые соединения (потоки aiosqlite) не дают процессу завершиться
+        await dispose_engines()
+        raise
+    if settings.WRITE_COALESCING:
+        start_write_coalescer(SessionLocal)
+    start_password_hasher()
+    if settings.SEARCH_BACKEND == "memory":
+        # Индекс строится до приёма запросов, дальше обновляется инкрементально
+        await start_search_index(read_engine)
+    if settings.AUTH_MODE == "stateless":
+        # Карта отзыва токенов строится до приёма запросов
+        await start_revocations(read_engine)
     yield
     # Очистка на завершении
-    pass
+    await stop_revocations()
+    stop_password_hasher()
+    await stop_search_index()
+    await stop_write_coalescer()
+    await dispose_engines()
 
 app = FastAPI(
     title="Advertisement API",
@@ -28,10 +56,23 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Токен согласованности для чтения своих записей при работе с репликами
+app.add_middleware(ConsistencyTokenMiddleware)
+
+# Пул bcrypt переполнен (passwords.py): деградируют только входы и смены пароля
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many password operations in progress, retry later"},
+        headers={"Retry-After": "1"},
+    )
+
 # Подключение роутеров
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(advertisements.router)
+app.include_router(stats.router)
 
 @app.get("/")
 def read_root():
@@ -43,4 +84,17 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/metrics")
+def metrics():
+    # Живая статистика пулов: занятые соединения, overflow, время ожидания
+    return {
+        "database": get_pool_stats(),
+        "write_queue": get_write_queue_stats(),
+        "search_index": get_search_index_stats(),
+        "token_cache": get_token_cache_stats(),
+        "principal_cache": get_principal_cache_stats(),
+        "token_revocations": get_revocation_stats(),
+        "password_hashing": get_password_hasher_stats(),
+    }
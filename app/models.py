@@ -1,8 +1,16 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Enum, Boolean
+from sqlalchemy import BigInteger, Column, Date, Integer, String, DateTime, ForeignKey, Text, Enum, Boolean, Index
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import enum
+from .counts import attach_counter_ddl
 from .database import Base
+from .fulltext import attach_fulltext_ddl
+
+# SQLite пишет CURRENT_TIMESTAMP с точностью до секунды, а bind-параметры
+# DateTime по умолчанию — с микросекундами. Один формат для обоих, иначе
+# сравнения с created_at (фильтры, keyset-курсоры) ошибаются на равенстве
+Timestamp = DateTime(timezone=True).with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite")
 
 class UserGroup(str, enum.Enum):
     USER = "user"
@@ -17,9 +25,30 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     group = Column(Enum(UserGroup), default=UserGroup.USER, nullable=False)
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+    # Растёт при смене пароля, группы, имени и при удалении: токены с
+    # меньшей версией (claim "ver") отзываются
+    token_version = Column(Integer, nullable=False, default=0, server_default=text("0"))
     
-    advertisements = relationship("Advertisement", back_populates="owner", cascade="all, delete-orphan")
+    # write_only: коллекция никогда не загружается целиком (у продавца могут
+    # быть тысячи объявлений), только запросом user.advertisements.select().
+    # Листинг объявлений пользователя — GET /user/{id}/advertisements.
+    # passive_deletes: пользователи удаляются мягко (is_active), жёсткое
+    # удаление не перебирает объявления в памяти
+    advertisements = relationship(
+        "Advertisement", back_populates="owner", cascade="all, delete-orphan",
+        lazy="write_only", passive_deletes=True
+    )
+
+    # Частичный индекс: удалённые (is_active = false) пользователи в него не
+    # попадают, листинг активных идёт по нему в порядке id
+    __table_args__ = (
+        Index(
+            "ix_users_active_id", "id",
+            sqlite_where=text("is_active = 1"),
+            postgresql_where=text("is_active"),
+        ),
+    )
 
 class Advertisement(Base):
     __tablename__ = "advertisements"
@@ -29,7 +58,84 @@ class Advertisement(Base):
     description = Column(Text)
     price = Column(Integer, nullable=False)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+    updated_at = Column(Timestamp, onupdate=func.now())
     
-    owner = relationship("User", back_populates="advertisements")
+    # Владелец загружается только явно (selectinload, expand=owner): ленивая
+    # загрузка в async-сессии невозможна, а по строке на объявление — N+1
+    owner = relationship("User", back_populates="advertisements", lazy="noload")
+
+    # Индексы под разрешённые сортировки и фильтры листинга (см. listing.py)
+    __table_args__ = (
+        Index("ix_advertisements_price_id", "price", "id"),
+        Index("ix_advertisements_created_at_id", "created_at", "id"),
+        Index("ix_advertisements_owner_id_created_at", "owner_id", "created_at", "id"),
+    )
+
+# Полнотекстовый индекс создаётся вместе с таблицей объявлений
+attach_fulltext_ddl(Advertisement.__table__)
+
+class DataMigrationCheckpoint(Base):
+    """Прогресс пакетного backfill'а (см. backfill.py): последний обработанный id."""
+    __tablename__ = "data_migration_checkpoints"
+
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False)
+    updated_at = Column(Timestamp, server_default=func.now())
+    finished_at = Column(Timestamp)
+
+class RowCount(Base):
+    """Число строк таблицы для include_total на SQLite; ведут триггеры (см. counts.py)."""
+    __tablename__ = "row_counts"
+
+    name = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+# Триггеры счётчиков создаются после всех таблиц
+attach_counter_ddl(Base.metadata)
+
+class OwnerAdvertisementStats(Base):
+    """Сводка цен объявлений владельца; ведёт rollups.py в транзакции изменения объявления."""
+    __tablename__ = "advertisement_owner_stats"
+
+    owner_id = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False)
+    price_sum = Column(BigInteger, nullable=False)
+    price_min = Column(Integer, nullable=False)
+    price_max = Column(Integer, nullable=False)
+
+class DailyAdvertisementStats(Base):
+    """Сводка цен объявлений, созданных за день (UTC)."""
+    __tablename__ = "advertisement_daily_stats"
+
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False)
+    price_sum = Column(BigInteger, nullable=False)
+    price_min = Column(Integer, nullable=False)
+    price_max = Column(Integer, nullable=False)
+
+class RefreshToken(Base):
+    """Refresh-токен: в базе только SHA-256 от него, сам токен знает лишь клиент.
+
+    При обмене токен гасится (revoked_at) и выдаётся следующий из той же
+    цепочки (family_id). token_version — версия пользователя при выдаче:
+    после смены пароля, группы или удаления токен не обменивается.
+
+    Погашенные строки нужны для обнаружения повторного предъявления, поэтому
+    удаляются только после expires_at — при следующем входе того же
+    пользователя (crud.create_refresh_token).
+    """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String, unique=True, nullable=False)
+    family_id = Column(String, nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    token_version = Column(Integer, nullable=False)
+    expires_at = Column(Timestamp, nullable=False)
+    created_at = Column(Timestamp, server_default=func.now())
+    revoked_at = Column(Timestamp)
+
+    __table_args__ = (
+        Index("ix_refresh_tokens_user_id_expires_at", "user_id", "expires_at"),
+    )
@@ -0,0 +1,105 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response, status
+
+# Курсор следующей страницы отдаём заголовком: тело ответа остаётся списком,
+# как и раньше, а клиенты без курсоров продолжают работать через skip/limit
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Общее число строк (include_total) и признак того, что оно точное, а не оценка
+TOTAL_COUNT_HEADER = "X-Total-Count"
+TOTAL_COUNT_EXACT_HEADER = "X-Total-Count-Exact"
+
+
+def encode_cursor(key: dict) -> str:
+    """Упаковывает ключ сортировки последней строки страницы в непрозрачный курсор."""
+    raw = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Распаковывает курсор; испорченный курсор — ошибка клиента (400)."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+        if not isinstance(key, dict):
+            raise ValueError("cursor must encode an object")
+        return key
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+
+def decode_id_cursor(cursor: Optional[str]) -> Optional[int]:
+    """Курсор по id: возвращает id последней строки предыдущей страницы."""
+    if cursor is None:
+        return None
+    after_id = decode_cursor(cursor).get("id")
+    if not isinstance(after_id, int):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+    return after_id
+
+
+def decode_keyset_cursor(cursor: Optional[str], sort_key: str) -> Optional[Tuple[Any, int]]:
+    """Курсор по ключу сортировки: (значение ключа, id) последней строки страницы.
+
+    Курсор, выданный для другой сортировки, не подходит — это ошибка клиента.
+    """
+    if cursor is None:
+        return None
+    key = decode_cursor(cursor)
+    after_id = key.get("id")
+    value = key.get(sort_key)
+    try:
+        if not isinstance(after_id, int) or value is None:
+            raise ValueError("cursor does not match the sort key")
+        if sort_key == "created_at":
+            value = datetime.fromisoformat(value)
+        elif not isinstance(value, int):
+            raise ValueError("cursor does not match the sort key")
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+    return value, after_id
+
+
+def set_next_cursor(response: Response, rows: Sequence, limit: int, sort_key: str = "id"):
+    """Выставляет X-Next-Cursor, если страница заполнена и дальше могут быть строки."""
+    if rows and len(rows) >= limit:
+        last = rows[-1]
+        value = getattr(last, sort_key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor({sort_key: value, "id": last.id})
+
+
+def decode_offset_cursor(cursor: Optional[str], skip: int) -> int:
+    """Курсор по смещению — для выдачи, упорядоченной по релевантности, а не по id."""
+    if cursor is None:
+        return skip
+    offset = decode_cursor(cursor).get("offset")
+    if not isinstance(offset, int) or offset < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+    return offset
+
+
+def set_next_offset_cursor(response: Response, rows: Sequence, skip: int, limit: int):
+    if rows and len(rows) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor({"offset": skip + len(rows)})
+
+
+def set_total_count(response: Response, total: int, exact: bool):
+    response.headers[TOTAL_COUNT_HEADER] = str(total)
+    response.headers[TOTAL_COUNT_EXACT_HEADER] = "true" if exact else "false"
@@ -0,0 +1,121 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+from .config import settings
+
+# Хеширование паролей bcrypt вне event loop и вне общего пула потоков.
+#
+# bcrypt занимает процессор на сотни миллисекунд. В общем пуле потоков
+# всплеск входов занимает потоки, нужные остальным эндпоинтам, поэтому
+# пароли считает отдельный пул (по умолчанию — процессов). Одновременных
+# операций не больше PASSWORD_HASH_MAX_PENDING: сверх этого —
+# PasswordHasherBusy (в main.py — ответ 503), и при шторме логинов
+# деградируют только логины.
+#
+# Модуль импортирует только passlib и настройки (без fastapi): процессы пула
+# (spawn) загружают его, а не всё приложение.
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь операций с паролями заполнена: запрос стоит повторить позже."""
+
+
+class PasswordHasher:
+    """Выполняет операции с паролями в executor с ограничением очереди."""
+
+    def __init__(self, executor: Executor, max_pending: int):
+        self._executor = executor
+        self._max_pending = max_pending
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    async def run(self, function, *args):
+        if self._pending >= self._max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        finally:
+            self._pending -= 1
+            # Ожидание в очереди пула плюс сам bcrypt
+            elapsed = time.perf_counter() - started
+            self.completed += 1
+            self._total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "pending": self._pending,
+            "max_pending": self._max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_latency_ms": round(self._total_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "max_latency_ms": round(self.max_seconds * 1000, 2),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+hasher: Optional[PasswordHasher] = None
+
+
+async def hash_password(password: str) -> str:
+    if hasher is None:
+        # Вне приложения (скрипты, миграции) — в пуле потоков по умолчанию
+        return await asyncio.get_running_loop().run_in_executor(None, get_password_hash, password)
+    return await hasher.run(get_password_hash, password)
+
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    if hasher is None:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, verify_password, plain_password, hashed_password
+        )
+    return await hasher.run(verify_password, plain_password, hashed_password)
+
+
+def get_password_hasher_stats() -> dict:
+    if hasher is None:
+        return {"enabled": False}
+    return hasher.stats()
+
+
+def start_password_hasher():
+    global hasher
+    workers = settings.PASSWORD_HASH_WORKERS
+    if settings.PASSWORD_HASH_EXECUTOR == "thread":
+        # bcrypt отпускает GIL: потоки тоже считают параллельно, но в одном процессе
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+    else:
+        # spawn, а не fork: у процесса приложения уже есть потоки и event loop
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    hasher = PasswordHasher(executor, max_pending=settings.PASSWORD_HASH_MAX_PENDING)
+
+
+def stop_password_hasher():
+    global hasher
+    if hasher is not None:
+        hasher.shutdown()
+        hasher = None
@@ -0,0 +1,44 @@
+import time
+from typing import Optional
+
+from . import schemas
+from .cache import ExpiringLRUCache
+from .config import settings
+
+# Кеш принципалов для get_current_user: user_id -> Principal (id, username,
+# group, is_active) на PRINCIPAL_CACHE_TTL_SECONDS. Проверка токена на каждом
+# запросе перестаёт ходить в базу.
+#
+# crud.update_user и crud.delete_user сбрасывают запись после commit, поэтому
+# на этом процессе изменения действуют сразу. Другие процессы (воркеры, узлы)
+# увидят их не позже чем через TTL.
+
+_cache = ExpiringLRUCache(settings.PRINCIPAL_CACHE_SIZE)
+# Номер поколения растёт при каждом сбросе. Чтение, начатое до сброса, могло
+# получить строку до изменения — такой результат в кеш не кладём
+_generation = 0
+
+
+def get_principal(user_id: int) -> Optional[schemas.Principal]:
+    return _cache.get(user_id)
+
+
+def generation() -> int:
+    """Поколение кеша; передаётся в put_principal после чтения пользователя из базы."""
+    return _generation
+
+
+def put_principal(principal: schemas.Principal, loaded_generation: int):
+    if loaded_generation != _generation:
+        return
+    _cache.put(principal.id, principal, time.time() + settings.PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+def invalidate_principal(user_id: int):
+    global _generation
+    _generation += 1
+    _cache.pop(user_id)
+
+
+def get_principal_cache_stats() -> dict:
+    return _cache.stats()
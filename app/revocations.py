@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from . import models
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Отзыв токенов для AUTH_MODE=stateless: user_id -> текущий token_version.
+#
+# Токен несёт версию пользователя на момент входа (claim "ver"). Смена
+# пароля, группы или имени и удаление увеличивают users.token_version, и
+# токены со старой версией отклоняются без запроса к базе. В карте только
+# пользователи с версией > 0 — те, у кого хоть раз отзывались токены; она
+# строится из базы на старте и перестраивается каждые
+# AUTH_REVOCATION_REFRESH_SECONDS: так отзывы с других процессов доходят
+# до этого. Свои отзывы процесс записывает сразу после commit.
+
+_versions: Dict[int, int] = {}
+_enabled = False  # карта ведётся только в режиме stateless (start_revocations)
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def is_revoked(user_id: int, token_version: int) -> bool:
+    return token_version < _versions.get(user_id, 0)
+
+
+def record_token_version(user_id: int, token_version: int):
+    if not _enabled:
+        return
+    # Перестройка могла прочитать более новую версию, чем запись процесса
+    if token_version > _versions.get(user_id, 0):
+        _versions[user_id] = token_version
+
+
+def get_revocation_stats() -> dict:
+    return {"users": len(_versions)}
+
+
+async def load_token_versions(db_engine: AsyncEngine) -> Dict[int, int]:
+    stmt = select(models.User.id, models.User.token_version).where(models.User.token_version > 0)
+    async with db_engine.connect() as conn:
+        result = await conn.execute(stmt)
+        return dict(result.all())
+
+
+async def _refresh_periodically(db_engine: AsyncEngine, interval: float):
+    global _versions
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            loaded = await load_token_versions(db_engine)
+            # Отзывы, записанные во время чтения, не теряем
+            for user_id, token_version in _versions.items():
+                if token_version > loaded.get(user_id, 0):
+                    loaded[user_id] = token_version
+            _versions = loaded
+        except Exception:
+            # Остаёмся на прежней карте до следующей попытки
+            logger.exception("token revocation refresh failed")
+
+
+async def start_revocations(db_engine: AsyncEngine):
+    global _versions, _enabled, _refresh_task
+    _versions = await load_token_versions(db_engine)
+    _enabled = True
+    if settings.AUTH_REVOCATION_REFRESH_SECONDS > 0:
+        _refresh_task = asyncio.create_task(
+            _refresh_periodically(db_engine, settings.AUTH_REVOCATION_REFRESH_SECONDS)
+        )
+
+
+async def stop_revocations():
+    global _versions, _enabled, _refresh_task
+    _enabled = False
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
+    _versions = {}
@@ -0,0 +1,161 @@
+"""Сводки по объявлениям: по владельцу и по дню создания (UTC).
+
+Для каждой группы хранятся число объявлений, сумма, минимум и максимум цены.
+Сводки меняются в той же транзакции, что и объявление
+(crud.create/update/delete_advertisement), поэтому дашборд читает одну
+строку по первичному ключу вместо прохода по advertisements.
+
+Число и сумму при удалении можно вычесть, минимум и максимум — нет: если
+удалённая цена была крайней, они пересчитываются по строкам одной группы
+через индекс (owner_id, created_at, id) или (created_at, id).
+
+Полная перестройка для починки::
+
+    python -m app.rollups rebuild
+"""
+import argparse
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Tuple
+
+from sqlalchemy import Date, and_, case, cast, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from . import models
+
+# INSERT ... ON CONFLICT DO UPDATE есть в обеих поддерживаемых СУБД
+_UPSERT = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def _day(created_at: datetime) -> date:
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    return created_at.date()
+
+
+def _groups(owner_id: int, created_at: datetime) -> List[Tuple[type, dict, object]]:
+    """Сводки, в которые входит объявление: (модель, ключ, условие на advertisements)."""
+    day = _day(created_at)
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    created = models.Advertisement.created_at
+    return [
+        (models.OwnerAdvertisementStats, {"owner_id": owner_id}, models.Advertisement.owner_id == owner_id),
+        (models.DailyAdvertisementStats, {"day": day},
+         and_(created >= start, created < start + timedelta(days=1))),
+    ]
+
+
+async def _add(session: AsyncSession, model, key: dict, price: int):
+    stats = model.__table__
+    stmt = _UPSERT[session.bind.dialect.name](stats).values(
+        **key, count=1, price_sum=price, price_min=price, price_max=price
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key),
+        set_={
+            "count": stats.c.count + 1,
+            "price_sum": stats.c.price_sum + price,
+            "price_min": case((stats.c.price_min > price, price), else_=stats.c.price_min),
+            "price_max": case((stats.c.price_max < price, price), else_=stats.c.price_max),
+        },
+    )
+    await session.execute(stmt)
+
+
+async def _remove(session: AsyncSession, model, key: dict, scope, price: int):
+    """Вычитает цену из сводки. Объявление к этому моменту уже удалено или изменено."""
+    stats = model.__table__
+    where = [stats.c[name] == value for name, value in key.items()]
+    row = (await session.execute(
+        update(stats).where(*where)
+        .values(count=stats.c.count - 1, price_sum=stats.c.price_sum - price)
+        .returning(stats.c.count, stats.c.price_min, stats.c.price_max)
+    )).first()
+    if row is None:
+        # Сводки нет — её расхождение исправит rebuild
+        return
+    if row.count <= 0:
+        await session.execute(delete(stats).where(*where))
+    elif price <= row.price_min or price >= row.price_max:
+        prices = select(models.Advertisement.price).where(scope)
+        await session.execute(
+            update(stats).where(*where).values(
+                price_min=prices.with_only_columns(func.min(models.Advertisement.price)).scalar_subquery(),
+                price_max=prices.with_only_columns(func.max(models.Advertisement.price)).scalar_subquery(),
+            )
+        )
+
+
+async def advertisement_created(session: AsyncSession, owner_id: int, created_at: datetime, price: int):
+    for model, key, _ in _groups(owner_id, created_at):
+        await _add(session, model, key, price)
+
+
+async def advertisement_deleted(session: AsyncSession, owner_id: int, created_at: datetime, price: int):
+    for model, key, scope in _groups(owner_id, created_at):
+        await _remove(session, model, key, scope, price)
+
+
+async def advertisement_repriced(
+    session: AsyncSession, owner_id: int, created_at: datetime, old_price: int, new_price: int
+):
+    if old_price == new_price:
+        return
+    for model, key, scope in _groups(owner_id, created_at):
+        await _remove(session, model, key, scope, old_price)
+        await _add(session, model, key, new_price)
+
+
+def rebuild_statements(dialect: str) -> list:
+    """Операторы полной перестройки сводок по advertisements."""
+    advertisement = models.Advertisement
+    if dialect == "postgresql":
+        day = cast(func.timezone("UTC", advertisement.created_at), Date)
+    else:
+        # SQLite хранит created_at в UTC строкой 'YYYY-MM-DD HH:MM:SS'
+        day = func.date(advertisement.created_at)
+    aggregates = (
+        func.count(),
+        func.sum(advertisement.price),
+        func.min(advertisement.price),
+        func.max(advertisement.price),
+    )
+    statements = []
+    for model, group in (
+        (models.OwnerAdvertisementStats, advertisement.owner_id),
+        (models.DailyAdvertisementStats, day),
+    ):
+        stats = model.__table__
+        key = stats.primary_key.columns.values()[0]
+        statements.append(delete(stats))
+        statements.append(
+            insert(stats).from_select(
+                [key.name, "count", "price_sum", "price_min", "price_max"],
+                select(group, *aggregates).group_by(group),
+            )
+        )
+    return statements
+
+
+async def rebuild(db_engine: AsyncEngine):
+    """Пересчитывает все сводки одной транзакцией: читатели видят старые или новые."""
+    async with db_engine.begin() as conn:
+        for statement in rebuild_statements(db_engine.dialect.name):
+            await conn.execute(statement)
+
+
+async def _main(command: str):
+    from .database import dispose_engines, engine
+
+    try:
+        if command == "rebuild":
+            await rebuild(engine)
+    finally:
+        await dispose_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m app.rollups", description="Advertisement statistics rollups")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: recompute all rollups from advertisements")
+    asyncio.run(_main(parser.parse_args().command))
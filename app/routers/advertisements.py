@@ -1,39 +1,125 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Response  # ✅ Добавили Response
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
+from datetime import datetime
 
-from .. import crud, schemas, dependencies
-from ..database import get_db
+from .. import crud, schemas, dependencies, listing
+from ..models import UserGroup
+from ..database import get_db, get_read_db
+from ..pagination import (
+    decode_keyset_cursor, decode_offset_cursor, set_next_cursor, set_next_offset_cursor, set_total_count
+)
 
 router = APIRouter(prefix="/advertisement", tags=["advertisements"])
 
+EXPANSIONS = {"owner"}
+EXPAND_DESCRIPTION = "Comma-separated related objects to embed: owner"
+
+def _expand_owner(expand: Optional[str]) -> bool:
+    """Разбирает expand; неизвестное имя — ошибка клиента, а не молчаливый пропуск."""
+    if not expand:
+        return False
+    names = {name.strip() for name in expand.split(",") if name.strip()}
+    unknown = names - EXPANSIONS
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown expand: {', '.join(sorted(unknown))}",
+        )
+    return "owner" in names
+
 @router.get("/{advertisement_id}", response_model=schemas.AdvertisementResponse)
-def read_advertisement(
+async def read_advertisement(
     advertisement_id: int,
-    db: Session = Depends(get_db)
+    expand: Optional[str] = Query(None, description=EXPAND_DESCRIPTION),
+    db: AsyncSession = Depends(get_read_db)
 ):
     # Все могут читать объявления
-    db_advertisement = crud.get_advertisement(db, advertisement_id=advertisement_id)
+    db_advertisement = await crud.get_advertisement(
+        db, advertisement_id=advertisement_id, expand_owner=_expand_owner(expand)
+    )
     if db_advertisement is None:
         raise HTTPException(status_code=404, detail="Advertisement not found")
     return db_advertisement
 
 @router.get("/", response_model=List[schemas.AdvertisementResponse])
-def read_advertisements(
+async def read_advertisements(
+    response: Response,
     search: Optional[str] = Query(None, description="Search in title and description"),
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    price_min: Optional[int] = Query(None, ge=0),
+    price_max: Optional[int] = Query(None, ge=0),
+    owner_id: Optional[int] = None,
+    created_after: Optional[datetime] = Query(None, description="Inclusive, UTC if no timezone given"),
+    created_before: Optional[datetime] = Query(None, description="Exclusive, UTC if no timezone given"),
+    sort: Optional[str] = Query(
+        None, description="id, price or created_at; prefix with '-' for descending order"
+    ),
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor of the previous page"),
+    include_total: bool = Query(
+        False, description="Return X-Total-Count; X-Total-Count-Exact tells whether it is exact"
+    ),
+    expand: Optional[str] = Query(None, description=EXPAND_DESCRIPTION),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db)
 ):
     # Все могут искать объявления
-    advertisements = crud.get_advertisements(db, skip=skip, limit=limit, search=search)
+    expand_owner = _expand_owner(expand)
+    filters = schemas.AdvertisementFilters(
+        price_min=price_min,
+        price_max=price_max,
+        owner_id=owner_id,
+        created_after=created_after,
+        created_before=created_before,
+    )
+    if search:
+        if sort is not None or listing.used_filters(filters):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Search results are ordered by relevance and cannot be filtered or sorted",
+            )
+        # Выдача поиска упорядочена по релевантности: курсор хранит смещение
+        skip = decode_offset_cursor(after, skip)
+        if include_total:
+            advertisements, total, exact = await crud.get_advertisements_with_total(
+                db, skip=skip, limit=limit, search=search, expand_owner=expand_owner
+            )
+            set_total_count(response, total, exact)
+        else:
+            advertisements = await crud.get_advertisements(
+                db, skip=skip, limit=limit, search=search, expand_owner=expand_owner
+            )
+        set_next_offset_cursor(response, advertisements, skip, limit)
+        return advertisements
+
+    # Разрешены только сочетания фильтров и сортировок, покрытые индексом
+    try:
+        sort_key, descending = listing.plan_listing(filters, sort)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    page = dict(
+        skip=skip,
+        limit=limit,
+        filters=filters,
+        sort=sort_key,
+        descending=descending,
+        after=decode_keyset_cursor(after, sort_key),
+        expand_owner=expand_owner
+    )
+    if include_total:
+        advertisements, total, exact = await crud.get_advertisements_with_total(db, **page)
+        set_total_count(response, total, exact)
+    else:
+        advertisements = await crud.get_advertisements(db, **page)
+    set_next_cursor(response, advertisements, limit, sort_key)
     return advertisements
 
 @router.post("/", response_model=schemas.AdvertisementResponse, status_code=status.HTTP_201_CREATED)
-def create_advertisement(
+async def create_advertisement(
     advertisement: schemas.AdvertisementCreate,
     current_user = Depends(dependencies.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if current_user is None:
         raise HTTPException(
@@ -41,39 +127,62 @@ def create_advertisement(
             detail="Authentication required",
         )
     
-    return crud.create_advertisement(
+    return await crud.create_advertisement(
         db=db, 
         advertisement=advertisement, 
         owner_id=current_user.id
     )
 
+def _owner_scope(current_user) -> Optional[int]:
+    if current_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Authentication required",
+        )
+    # Администратор может менять любые объявления, остальные — только свои
+    return None if current_user.group == UserGroup.ADMIN else current_user.id
+
 @router.patch("/{advertisement_id}", response_model=schemas.AdvertisementResponse)
-def update_advertisement(
+async def update_advertisement(
     advertisement_id: int,
     advertisement_update: schemas.AdvertisementUpdate,
-    current_user = Depends(
-        lambda: dependencies.check_permissions(advertisement_id=advertisement_id)
-    ),
-    db: Session = Depends(get_db)
+    current_user = Depends(dependencies.get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    db_advertisement = crud.update_advertisement(
-        db=db, 
-        advertisement_id=advertisement_id, 
-        advertisement_update=advertisement_update
-    )
+    # Проверка владения входит в сам UPDATE: без отдельной загрузки объявления
+    try:
+        db_advertisement = await crud.update_advertisement(
+            db=db, 
+            advertisement_id=advertisement_id, 
+            advertisement_update=advertisement_update,
+            owner_id=_owner_scope(current_user)
+        )
+    except PermissionError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions",
+        )
     if db_advertisement is None:
         raise HTTPException(status_code=404, detail="Advertisement not found")
     return db_advertisement
 
 @router.delete("/{advertisement_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_advertisement(
+async def delete_advertisement(
     advertisement_id: int,
-    current_user = Depends(
-        lambda: dependencies.check_permissions(advertisement_id=advertisement_id)
-    ),
-    db: Session = Depends(get_db)
+    current_user = Depends(dependencies.get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    success = crud.delete_advertisement(db=db, advertisement_id=advertisement_id)
+    try:
+        success = await crud.delete_advertisement(
+            db=db,
+            advertisement_id=advertisement_id,
+            owner_id=_owner_scope(current_user)
+        )
+    except PermissionError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions",
+        )
     if not success:
         raise HTTPException(status_code=404, detail="Advertisement not found")
     # ✅ Явно возвращаем Response с 204 статусом
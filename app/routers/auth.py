@@ -1,36 +1,70 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 from typing import Optional
 
-from .. import crud, schemas, auth
+from .. import crud, schemas, auth, passwords
 from ..database import get_db
 
 router = APIRouter(prefix="", tags=["authentication"])
 
 @router.post("/login", response_model=schemas.Token)
-def login(
+async def login(
     login_request: schemas.LoginRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    user = crud.get_user_by_username(db, username=login_request.username)
+    user = await crud.get_user_by_username(db, username=login_request.username)
     
-    if not user or not auth.verify_password(login_request.password, user.hashed_password):
+    if not user or not await passwords.check_password(login_request.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    access_token_expires = timedelta(hours=auth.ACCESS_TOKEN_EXPIRE_HOURS)
+
+    refresh_token = await crud.create_refresh_token(db, user)
+    return _token_response(user, refresh_token)
+
+@router.post("/refresh", response_model=schemas.Token)
+async def refresh(
+    refresh_request: schemas.RefreshRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    # Единственное обращение к базе за время жизни access-токена: здесь
+    # отсекаются удалённые пользователи и токены до смены пароля или группы
+    rotated = await crud.rotate_refresh_token(db, refresh_request.refresh_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user, refresh_token = rotated
+    return _token_response(user, refresh_token)
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    refresh_request: schemas.RefreshRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    await crud.revoke_refresh_token(db, refresh_request.refresh_token)
+
+def _token_response(user, refresh_token: str) -> dict:
+    access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
         data={
             "sub": user.username,
             "user_id": user.id,
-            "group": user.group.value
+            "group": user.group.value,
+            "ver": user.token_version
         },
         expires_delta=access_token_expires
     )
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": int(access_token_expires.total_seconds()),
+    }
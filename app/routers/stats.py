@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from datetime import date, datetime, timedelta, timezone
+
+from .. import crud, schemas, dependencies
+from ..database import get_read_db
+
+# Статистика объявлений для дашбордов: читается из сводок (rollups.py),
+# каждая строка ответа — одна строка сводки, без прохода по объявлениям
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+MAX_DAYS = 366
+
+@router.get("/owners", response_model=List[schemas.OwnerAdvertisementStats],
+            dependencies=[Depends(dependencies.require_admin)])
+async def read_owners_stats(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return await crud.get_owners_stats(db, skip=skip, limit=limit)
+
+@router.get("/owners/{user_id}", response_model=schemas.OwnerAdvertisementStats,
+            dependencies=[Depends(dependencies.check_permissions)])
+async def read_owner_stats(
+    user_id: int,
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Свою статистику видит владелец, любую — администратор (check_permissions)
+    stats = await crud.get_owner_stats(db, owner_id=user_id)
+    if stats is None:
+        return schemas.OwnerAdvertisementStats(owner_id=user_id, count=0, price_sum=0)
+    return stats
+
+@router.get("/days", response_model=List[schemas.DailyAdvertisementStats],
+            dependencies=[Depends(dependencies.require_admin)])
+async def read_daily_stats(
+    date_from: Optional[date] = Query(None, description="Inclusive, UTC; default: 30 days before date_to"),
+    date_to: Optional[date] = Query(None, description="Inclusive, UTC; default: today"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if date_to is None:
+        date_to = datetime.now(timezone.utc).date()
+    if date_from is None:
+        date_from = date_to - timedelta(days=30)
+    if date_from > date_to or (date_to - date_from).days >= MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"date_from must not be after date_to, at most {MAX_DAYS} days",
+        )
+    return await crud.get_daily_stats(db, date_from=date_from, date_to=date_to)
@@ -1,67 +1,135 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
-from .. import crud, schemas, dependencies
-from ..database import get_db
+from .. import crud, schemas, dependencies, listing
+from ..database import get_db, get_read_db
+from ..pagination import decode_id_cursor, decode_keyset_cursor, set_next_cursor, set_total_count
 
 router = APIRouter(prefix="/user", tags=["users"])
 
 @router.post("/", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(
+async def create_user(
     user: schemas.UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
-        return crud.create_user(db=db, user=user)
+        return await crud.create_user(db=db, user=user)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,  
             detail=str(e)
         )
 
+async def _list_user_advertisements(
+    response: Response, db: AsyncSession, owner_id: int, sort: str, after: Optional[str], limit: int
+):
+    """Объявления владельца по индексу (owner_id, created_at, id), keyset-курсор.
+
+    Число объявлений — из сводки по владельцу (rollups.py): одна строка по
+    ключу, и оно точное, потому что сводка меняется в транзакции объявления.
+    """
+    filters = schemas.AdvertisementFilters(owner_id=owner_id)
+    try:
+        sort_key, descending = listing.plan_listing(filters, sort)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    advertisements = await crud.get_advertisements(
+        db,
+        limit=limit,
+        filters=filters,
+        sort=sort_key,
+        descending=descending,
+        after=decode_keyset_cursor(after, sort_key)
+    )
+    set_next_cursor(response, advertisements, limit, sort_key)
+    stats = await crud.get_owner_stats(db, owner_id=owner_id)
+    set_total_count(response, stats.count if stats is not None else 0, True)
+    return advertisements
+
+USER_ADVERTISEMENTS_SORT = Query(
+    "-created_at", description="created_at or -created_at (newest first)"
+)
+
+@router.get("/me/advertisements", response_model=List[schemas.AdvertisementResponse])
+async def read_my_advertisements(
+    response: Response,
+    sort: str = USER_ADVERTISEMENTS_SORT,
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user = Depends(dependencies.check_permissions),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return await _list_user_advertisements(response, db, current_user.id, sort, after, limit)
+
+@router.get("/{user_id}/advertisements", response_model=List[schemas.AdvertisementResponse])
+async def read_user_advertisements(
+    user_id: int,
+    response: Response,
+    sort: str = USER_ADVERTISEMENTS_SORT,
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Объявления публичны, как и GET /advertisement/
+    if await crud.get_user(db, user_id=user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return await _list_user_advertisements(response, db, user_id, sort, after, limit)
+
 @router.get("/{user_id}", response_model=schemas.UserResponse, 
             dependencies=[Depends(dependencies.get_current_user)])  
-def read_user(
+async def read_user(
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
 
-    db_user = crud.get_user(db, user_id=user_id)
+    db_user = await crud.get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 @router.get("/", response_model=List[schemas.UserResponse])
-def read_users(
-    skip: int = 0,
-    limit: int = 100,
+async def read_users(
+    response: Response,
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor of the previous page"),
+    include_total: bool = Query(
+        False, description="Return X-Total-Count; X-Total-Count-Exact tells whether it is exact"
+    ),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
     current_user = Depends(dependencies.check_permissions),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
 
-    users = crud.get_users(db, skip=skip, limit=limit)
+    after_id = decode_id_cursor(after)
+    if include_total:
+        users, total, exact = await crud.get_users_with_total(db, skip=skip, limit=limit, after_id=after_id)
+        set_total_count(response, total, exact)
+    else:
+        users = await crud.get_users(db, skip=skip, limit=limit, after_id=after_id)
+    set_next_cursor(response, users, limit)
     return users
 
 @router.patch("/{user_id}", response_model=schemas.UserResponse)
-def update_user(
+async def update_user(
     user_id: int,
     user_update: schemas.UserUpdate,
-    current_user = Depends(lambda: dependencies.check_permissions(user_id=user_id)),
-    db: Session = Depends(get_db)
+    current_user = Depends(dependencies.check_permissions),
+    db: AsyncSession = Depends(get_db)
 ):
-    db_user = crud.update_user(db=db, user_id=user_id, user_update=user_update)
+    db_user = await crud.update_user(db=db, user_id=user_id, user_update=user_update)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 @router.delete("/{user_id}", response_model=schemas.UserResponse)
-def delete_user(
+async def delete_user(
     user_id: int,
-    current_user = Depends(lambda: dependencies.check_permissions(user_id=user_id)),
-    db: Session = Depends(get_db)
+    current_user = Depends(dependencies.check_permissions),
+    db: AsyncSession = Depends(get_db)
 ):
-    db_user = crud.delete_user(db=db, user_id=user_id)
+    db_user = await crud.delete_user(db=db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
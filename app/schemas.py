@@ -1,17 +1,33 @@
-ffrom pydantic import BaseModel, Field, ConfigDict, field_validator
+from pydantic import BaseModel, Field, ConfigDict, field_validator
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime, timezone
 from .models import UserGroup  # ✅ Импортируем Enum из моделей
 
 # Token schemas
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None  # срок access-токена, секунды
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
     user_id: Optional[int] = None
     group: Optional[UserGroup] = None  # ✅ Используем Enum
+    token_version: int = 0  # claim "ver"; у токенов, выданных до его появления, — 0
+
+class Principal(BaseModel):
+    """Аутентифицированный пользователь запроса: то, что нужно для проверки прав."""
+    id: int
+    username: str
+    group: UserGroup
+    is_active: bool
+    token_version: int = 0
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 class LoginRequest(BaseModel):
     username: str
@@ -66,10 +82,45 @@ class AdvertisementUpdate(BaseModel):
     description: Optional[str] = None
     price: Optional[int] = Field(None, ge=0)
 
+class OwnerSummary(BaseModel):
+    id: int
+    username: str
+
+    model_config = ConfigDict(from_attributes=True)
+
 class AdvertisementResponse(AdvertisementBase):
     id: int
     owner_id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
+    owner: Optional[OwnerSummary] = None  # только при expand=owner
     
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+class AdvertisementFilters(BaseModel):
+    price_min: Optional[int] = None
+    price_max: Optional[int] = None
+    owner_id: Optional[int] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+    @field_validator('created_after', 'created_before')
+    def normalize_timezone(cls, v):
+        # created_at хранится в UTC; время без зоны тоже считаем UTC
+        if v is not None:
+            v = v.replace(tzinfo=timezone.utc) if v.tzinfo is None else v.astimezone(timezone.utc)
+        return v
+
+# Statistics schemas
+class AdvertisementStats(BaseModel):
+    count: int
+    price_sum: int
+    price_min: Optional[int] = None  # None — объявлений нет
+    price_max: Optional[int] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class OwnerAdvertisementStats(AdvertisementStats):
+    owner_id: int
+
+class DailyAdvertisementStats(AdvertisementStats):
+    day: date
@@ -0,0 +1,287 @@
+import asyncio
+import bisect
+import heapq
+import logging
+import math
+import re
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from . import models
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# Слово заголовка весит как два слова описания
+TITLE_WEIGHT = 2
+# Слово запроса ищется и как префикс (велосипед → велосипеда), но не короче
+# MIN_PREFIX_LENGTH символов и не более чем по MAX_PREFIX_EXPANSION терминам:
+# иначе короткие слова раскрываются в половину словаря
+MIN_PREFIX_LENGTH = 3
+MAX_PREFIX_EXPANSION = 16
+BUILD_BATCH_SIZE = 10000
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _WORD.findall(text.lower()) if text else []
+
+
+class SearchIndex:
+    """Инвертированный индекс объявлений в памяти процесса с ранжированием BM25.
+
+    Для каждого термина хранятся два параллельных массива: отсортированные id
+    объявлений и частоты термина в них. Индекс обновляется инкрементально при
+    создании, изменении и удалении объявления. Как и FTS-бэкенд, объявление
+    находится, только если в нём есть все слова запроса.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._terms: List[str] = []  # отсортированный словарь для поиска по префиксу
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self._doc_length: Dict[int, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_length)
+
+    def stats(self) -> dict:
+        return {"documents": len(self._doc_length), "terms": len(self._postings)}
+
+    def add(self, advertisement_id: int, title: Optional[str], description: Optional[str]):
+        for term in self._index_document(advertisement_id, title, description):
+            bisect.insort(self._terms, term)
+
+    def load(self, rows: Iterable[Tuple[int, Optional[str], Optional[str]]]):
+        """Массовая загрузка строк (id, title, description) при построении индекса."""
+        new_terms = []
+        for advertisement_id, title, description in rows:
+            new_terms.extend(self._index_document(advertisement_id, title, description))
+        # Словарь сортируется один раз на пачку, а не вставкой на каждый термин
+        self._terms.extend(new_terms)
+        self._terms.sort()
+
+    def _index_document(self, advertisement_id: int, title: Optional[str], description: Optional[str]) -> List[str]:
+        """Добавляет документ в списки; возвращает термины, которых не было в словаре."""
+        if advertisement_id in self._doc_length:
+            self.remove(advertisement_id)
+
+        new_terms = []
+        frequencies = Counter(tokenize(description))
+        for token in tokenize(title):
+            frequencies[token] += TITLE_WEIGHT
+        length = sum(frequencies.values())
+
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("i"), array("i"))
+                new_terms.append(term)
+            ids, tfs = postings
+            if not ids or ids[-1] < advertisement_id:
+                # Обычный случай: новые id больше всех уже проиндексированных
+                ids.append(advertisement_id)
+                tfs.append(frequency)
+            else:
+                position = bisect.bisect_left(ids, advertisement_id)
+                ids.insert(position, advertisement_id)
+                tfs.insert(position, frequency)
+
+        self._doc_terms[advertisement_id] = tuple(frequencies)
+        self._doc_length[advertisement_id] = length
+        self._total_length += length
+        return new_terms
+
+    def remove(self, advertisement_id: int):
+        terms = self._doc_terms.pop(advertisement_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._doc_length.pop(advertisement_id)
+        for term in terms:
+            ids, tfs = self._postings[term]
+            position = bisect.bisect_left(ids, advertisement_id)
+            del ids[position]
+            del tfs[position]
+            if not ids:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _expand(self, word: str) -> List[str]:
+        if len(word) < MIN_PREFIX_LENGTH:
+            return [word] if word in self._postings else []
+        start = bisect.bisect_left(self._terms, word)
+        end = bisect.bisect_left(self._terms, word + "\U0010ffff", start)
+        return self._terms[start:min(end, start + MAX_PREFIX_EXPANSION)]
+
+    def _frequency(self, term: str, advertisement_id: int) -> int:
+        ids, tfs = self._postings[term]
+        position = bisect.bisect_left(ids, advertisement_id)
+        if position < len(ids) and ids[position] == advertisement_id:
+            return tfs[position]
+        return 0
+
+    def search(self, query: str, skip: int = 0, limit: int = 100) -> Tuple[List[int], int]:
+        """id объявлений по убыванию BM25 (при равенстве — по возрастанию id)
+        и общее число найденных объявлений."""
+        words = tokenize(query)
+        if not words or not self._doc_length:
+            return [], 0
+
+        # Для каждого слова запроса — термины, которые оно покрывает как префикс
+        groups = []
+        for word in dict.fromkeys(words):
+            terms = self._expand(word)
+            if not terms:
+                return [], 0
+            groups.append(terms)
+
+        # Кандидаты — пересечение, начиная с самого редкого слова: дальше
+        # проверяем только их, а не сливаем длинные списки частых слов
+        def group_size(terms):
+            return sum(len(self._postings[term][0]) for term in terms)
+
+        groups.sort(key=group_size)
+        candidates = set()
+        for term in groups[0]:
+            candidates.update(self._postings[term][0])
+        for terms in groups[1:]:
+            if len(candidates) * 8 < group_size(terms):
+                candidates = {
+                    advertisement_id for advertisement_id in candidates
+                    if any(self._frequency(term, advertisement_id) for term in terms)
+                }
+            else:
+                matched = set()
+                for term in terms:
+                    matched.update(self._postings[term][0])
+                candidates &= matched
+            if not candidates:
+                return [], 0
+
+        documents = len(self._doc_length)
+        lengths = self._doc_length
+        # BM25: idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        base = self.k1 * (1 - self.b)
+        per_length = self.k1 * self.b * documents / self._total_length
+        scores: Dict[int, float] = dict.fromkeys(candidates, 0.0)
+        for terms in groups:
+            for term in terms:
+                ids, tfs = self._postings[term]
+                frequency = len(ids)
+                weight = math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5)) * (self.k1 + 1)
+                if len(scores) * 8 < frequency:
+                    # Кандидатов мало: ищем их в длинном списке бинарным поиском
+                    for advertisement_id in scores:
+                        tf = self._frequency(term, advertisement_id)
+                        if tf:
+                            scores[advertisement_id] += weight * tf / (tf + base + per_length * lengths[advertisement_id])
+                else:
+                    for advertisement_id, tf in zip(ids, tfs):
+                        if advertisement_id in scores:
+                            scores[advertisement_id] += weight * tf / (tf + base + per_length * lengths[advertisement_id])
+
+        top = heapq.nsmallest(skip + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [advertisement_id for advertisement_id, _ in top[skip:]], len(scores)
+
+
+# Индекс процесса; None — поиск идёт через базу данных
+index: Optional[SearchIndex] = None
+_refresh_task: Optional[asyncio.Task] = None
+# Изменения, сделанные процессом во время полной перестройки: перестройка
+# могла прочитать таблицу до них, поэтому они повторяются на новом индексе.
+# None — перестройка не идёт
+_changes_during_rebuild: Optional[List[Tuple]] = None
+
+
+def get_search_index_stats() -> dict:
+    if index is None:
+        return {"backend": "database"}
+    return {"backend": "memory", **index.stats()}
+
+
+async def build_index(db_engine: AsyncEngine) -> SearchIndex:
+    """Строит индекс по всем объявлениям, читая таблицу пачками."""
+    new_index = SearchIndex()
+    stmt = select(
+        models.Advertisement.id, models.Advertisement.title, models.Advertisement.description
+    ).order_by(models.Advertisement.id)
+    async with db_engine.connect() as conn:
+        result = await conn.stream(stmt.execution_options(yield_per=BUILD_BATCH_SIZE))
+        async for partition in result.partitions():
+            new_index.load(partition)
+    return new_index
+
+
+async def _refresh_periodically(db_engine: AsyncEngine, interval: float):
+    global index, _changes_during_rebuild
+    while True:
+        await asyncio.sleep(interval)
+        _changes_during_rebuild = []
+        try:
+            new_index = await build_index(db_engine)
+        except Exception:
+            # Остаёмся на прежнем индексе до следующей попытки
+            logger.exception("search index refresh failed")
+        else:
+            # Изменения, записанные во время чтения, не теряем; между повтором
+            # и заменой индекса нет await, новых изменений не появится
+            for change in _changes_during_rebuild:
+                _apply_change(new_index, change)
+            index = new_index
+        finally:
+            _changes_during_rebuild = None
+
+
+async def start_search_index(db_engine: AsyncEngine):
+    global index, _refresh_task
+    index = await build_index(db_engine)
+    if settings.SEARCH_INDEX_REFRESH_SECONDS > 0:
+        # Каждый процесс (воркер) видит только свои записи: полная
+        # перестройка подтягивает изменения, сделанные другими процессами
+        _refresh_task = asyncio.create_task(
+            _refresh_periodically(db_engine, settings.SEARCH_INDEX_REFRESH_SECONDS)
+        )
+
+
+async def stop_search_index():
+    global index, _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
+    index = None
+
+
+def _apply_change(target: SearchIndex, change: Tuple):
+    if change[0] == "add":
+        target.add(*change[1:])
+    else:
+        target.remove(change[1])
+
+
+def _record_change(change: Tuple):
+    if index is None:
+        return
+    _apply_change(index, change)
+    if _changes_during_rebuild is not None:
+        _changes_during_rebuild.append(change)
+
+
+def index_advertisement(advertisement: models.Advertisement):
+    _record_change(("add", advertisement.id, advertisement.title, advertisement.description))
+
+
+def remove_advertisement(advertisement_id: int):
+    _record_change(("remove", advertisement_id))
@@ -0,0 +1,184 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import InstanceState
+
+from .config import settings
+from .consistency import mark_committed
+
+WriteOperation = Callable[[AsyncSession], Awaitable[Any]]
+
+
+def _detach(session: AsyncSession, result: Any):
+    """Отвязывает ORM-объекты результата от общей сессии пачки.
+
+    Иначе следующая операция пачки, затронувшая ту же строку, получит тот же
+    объект из identity map и изменит его: вызывающий первой операции увидел
+    бы в ответе чужие значения.
+    """
+    if isinstance(result, (list, tuple)):
+        for item in result:
+            _detach(session, item)
+        return
+    state = inspect(result, raiseerr=False)
+    if isinstance(state, InstanceState) and state.session_id is not None:
+        session.expunge(result)
+
+
+class WriteCoalescer:
+    """Group commit: одна задача-писатель выполняет операции записи пачками.
+
+    Операции из конкурентных запросов складываются в очередь, писатель
+    выполняет их в одной транзакции и делает один commit (один fsync) на
+    пачку. Каждая операция получает свой результат или своё исключение:
+    если одна из операций падает, транзакция откатывается, упавшая операция
+    получает ошибку, а остальные выполняются повторно без неё.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker, max_batch: int, max_delay: float):
+        self._session_factory = session_factory
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._queue: "asyncio.Queue[Tuple[WriteOperation, asyncio.Future]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.operations = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Дожидаемся, пока писатель обработает всё, что уже в очереди
+        await self._queue.join()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, operation: WriteOperation):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operation, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._max_delay
+            while len(batch) < self._max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._commit_batch(batch)
+            except Exception as error:
+                # Писатель не должен умирать: ошибку получают все операции пачки
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit_batch(self, batch: List[Tuple[WriteOperation, asyncio.Future]]):
+        # Операции, чей вызывающий уже отменил ожидание, не выполняем
+        pending = [item for item in batch if not item[1].done()]
+        async with self._session_factory() as session:
+            while pending:
+                results = []
+                failed = None
+                for index, (operation, future) in enumerate(pending):
+                    try:
+                        result = await operation(session)
+                        # flush после каждой операции, чтобы ошибка ограничения
+                        # относилась именно к ней
+                        await session.flush()
+                        _detach(session, result)
+                        results.append(result)
+                    except Exception as error:
+                        failed = index, error
+                        break
+
+                if failed is not None:
+                    await session.rollback()
+                    index, error = failed
+                    _, future = pending.pop(index)
+                    if not future.done():
+                        future.set_exception(error)
+                    continue
+
+                try:
+                    await session.commit()
+                except Exception as error:
+                    await session.rollback()
+                    for _, future in pending:
+                        if not future.done():
+                            future.set_exception(error)
+                    return
+
+                self.batches += 1
+                self.operations += len(pending)
+                for (_, future), result in zip(pending, results):
+                    if not future.done():
+                        future.set_result(result)
+                return
+
+
+coalescer: Optional[WriteCoalescer] = None
+
+
+def get_write_queue_stats() -> dict:
+    if coalescer is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "queued": coalescer._queue.qsize(),
+        "batches": coalescer.batches,
+        "operations": coalescer.operations,
+        "avg_batch_size": round(coalescer.operations / coalescer.batches, 2) if coalescer.batches else 0.0,
+    }
+
+
+def start_write_coalescer(session_factory: async_sessionmaker):
+    global coalescer
+    coalescer = WriteCoalescer(
+        session_factory,
+        max_batch=settings.WRITE_BATCH_MAX_OPS,
+        max_delay=settings.WRITE_BATCH_MAX_DELAY_MS / 1000,
+    )
+    coalescer.start()
+
+
+async def stop_write_coalescer():
+    global coalescer
+    if coalescer is not None:
+        await coalescer.stop()
+        coalescer = None
+
+
+async def execute_write(db: AsyncSession, operation: WriteOperation):
+    """Выполняет операцию записи и фиксирует её.
+
+    В режиме WRITE_COALESCING операция уходит в group-commit очередь,
+    иначе выполняется в сессии запроса с отдельным commit.
+    """
+    # Завершаем начатую запросом транзакцию чтения: в режиме group commit это
+    # отпускает соединение, чтобы писатель не ждал его в том же пуле
+    if db.in_transaction():
+        await db.commit()
+    if coalescer is not None:
+        result = await coalescer.submit(operation)
+    else:
+        # Явная транзакция: все statements операции фиксируются вместе
+        async with db.begin():
+            result = await operation(db)
+    mark_committed(db)
+    return result
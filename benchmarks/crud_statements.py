@@ -0,0 +1,109 @@
+"""Микро-бенчмарк накладных расходов на построение и компиляцию запросов crud.
+
+Сравнивает прежнюю форму запросов (select() собирается заново на каждый
+вызов) с lambda_stmt из app/crud.py на одной и той же in-memory SQLite.
+
+Запуск из корня репозитория:
+    python -m benchmarks.crud_statements [--calls 20000]
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app import crud, models
+from app.database import Base
+
+
+# Прежние реализации: запрос собирается и проходит cache-key pipeline каждый раз
+async def get_user_select(db: AsyncSession, user_id: int):
+    result = await db.execute(
+        select(models.User).where(models.User.id == user_id, models.User.is_active == True)
+    )
+    return result.scalars().first()
+
+async def get_user_by_username_select(db: AsyncSession, username: str):
+    result = await db.execute(
+        select(models.User).where(models.User.username == username, models.User.is_active == True)
+    )
+    return result.scalars().first()
+
+
+CASES = [
+    ("get_user", get_user_select, crud.get_user, lambda i: {"user_id": i % 10 + 1}),
+    # Поиск объявлений идёт через полнотекстовый индекс обычным select(),
+    # поэтому здесь его нет: сравнение было бы ILIKE против FTS, а не кеширования
+    (
+        "get_user_by_username",
+        get_user_by_username_select,
+        crud.get_user_by_username,
+        lambda i: {"username": f"user{i % 10 + 1}"},
+    ),
+]
+
+
+async def setup():
+    engine = create_async_engine(
+        "sqlite+aiosqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as db:
+        for i in range(1, 11):
+            db.add(models.User(username=f"user{i}", email=f"user{i}@example.com", hashed_password="x"))
+        await db.flush()
+        for i in range(100):
+            db.add(models.Advertisement(title=f"ad {i}", description="bench", price=i, owner_id=i % 10 + 1))
+        await db.commit()
+    return engine, session_factory
+
+
+async def measure(session_factory, func, make_kwargs, calls: int) -> float:
+    async with session_factory() as db:
+        for i in range(100):  # прогрев кеша компиляции
+            await func(db, **make_kwargs(i))
+        started = time.perf_counter()
+        for i in range(calls):
+            await func(db, **make_kwargs(i))
+        return (time.perf_counter() - started) / calls
+
+
+def ids(result):
+    if result is None:
+        return []
+    if hasattr(result, "id"):
+        return [result.id]
+    return [row.id for row in result]
+
+
+async def check_same_results(session_factory):
+    # Значения из замыкания должны попадать в запрос, а не застревать в кеше
+    async with session_factory() as db:
+        for name, before, after, make_kwargs in CASES:
+            for i in range(10):
+                kwargs = make_kwargs(i)
+                assert ids(await before(db, **kwargs)) == ids(await after(db, **kwargs)), name
+
+
+async def main(calls: int):
+    engine, session_factory = await setup()
+    await check_same_results(session_factory)
+    print(f"{'query':<28}{'select() us/call':>18}{'lambda_stmt us/call':>22}{'speedup':>10}")
+    for name, before, after, make_kwargs in CASES:
+        before_time = await measure(session_factory, before, make_kwargs, calls)
+        after_time = await measure(session_factory, after, make_kwargs, calls)
+        print(
+            f"{name:<28}{before_time * 1e6:>18.1f}{after_time * 1e6:>22.1f}"
+            f"{before_time / after_time:>9.2f}x"
+        )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    asyncio.run(main(parser.parse_args().calls))